@@ -0,0 +1,264 @@
+# Description: Batched FocusGame simulator for self-play data generation.  N games are kept in NumPy arrays, one
+#               packed stack code per square as in FocusGame, and every step applies one move to each game with
+#               vectorised table lookups, shifts and masks instead of per-game Python calls.  Stack moves follow
+#               move_piece (turn check, then the checks in locationCheck) and reserve placements follow
+#               reserved_move, so each game ends up exactly where the same moves would take a FocusGame.
+#
+#               check_moves_array is the same validation for many candidate moves in one FocusGame, for UI hints
+#               and pruning move lists without touching the game.
+
+import random
+
+import numpy as np
+
+from domination import (BOARD_SIZE, INVALID_LOCATION, INVALID_NUMBER, NO_RESERVE, NOT_YOUR_TURN, OK, STACK_LIMIT,
+                        WIN_CAPTURES, FocusGame, _COLOR_BITS, _GREENS, _HEIGHT, _INITIAL_BOARD, _PIECES_SHIFT,
+                        _RESERVE_MOVES, _SQUARE_BITS, _SQUARE_MASK, _STACK_MOVES, _TOP)
+
+SQUARES = BOARD_SIZE * BOARD_SIZE
+
+# Result of one move in one game: FocusGame.play's status codes, plus one for games given no move.
+SKIPPED = 5
+
+# FocusGame's lookup tables as arrays, with -1 standing for the top colour of an empty square.
+_HEIGHTS = np.array(_HEIGHT, dtype=np.int32)
+_TOPS = np.array([-1 if top is None else top for top in _TOP], dtype=np.int32)
+_GREEN_COUNTS = np.array(_GREENS, dtype=np.int32)
+
+# Every move that can ever be legal, with its source square and number of pieces, for building legality masks.
+ALL_MOVES = np.array(sorted(set(move for moves in _STACK_MOVES for move in moves[STACK_LIMIT])
+                            | set(_RESERVE_MOVES)), dtype=np.int32)
+_ALL_ORIGINS = ALL_MOVES & _SQUARE_MASK
+_ALL_PIECES = ALL_MOVES >> _PIECES_SHIFT
+
+# _MOVE_TABLE[square, height] holds the moves out of a stack of that height, padded with -1, and _MOVE_COUNTS how
+# many there are, so a random move can be drawn per square without building a mask over every move.
+_MOVE_COUNTS = np.array([[len(moves) for moves in heights] for heights in _STACK_MOVES], dtype=np.int64)
+_MOVE_TABLE = np.full(_MOVE_COUNTS.shape + (_MOVE_COUNTS.max(),), -1, dtype=np.int64)
+for _square, _heights in enumerate(_STACK_MOVES):
+    for _height, _moves in enumerate(_heights):
+        _MOVE_TABLE[_square, _height, :len(_moves)] = _moves
+_SQUARE_INDEX = np.arange(SQUARES)
+
+
+def _location_checks(code, color, origin, target, num_pieces):
+    """Return locationCheck's checks, in the order it makes them, as (failed, status) pairs of a boolean array and
+    the status code of the moves that fail it.  code holds the stack on each move's source square."""
+    height = _HEIGHTS[code]
+    same_row = origin // BOARD_SIZE == target // BOARD_SIZE
+    same_column = origin % BOARD_SIZE == target % BOARD_SIZE
+    distance = np.where(same_row, np.abs(origin - target), np.abs(origin - target) // BOARD_SIZE)
+    return (
+        (origin >= SQUARES, INVALID_LOCATION),
+        (height == 0, INVALID_NUMBER),
+        (_TOPS[code] != color, INVALID_LOCATION),
+        (height < num_pieces, INVALID_NUMBER),
+        (target >= SQUARES, INVALID_LOCATION),
+        (~same_row & ~same_column, INVALID_LOCATION),
+        (distance > num_pieces, INVALID_LOCATION),
+    )
+
+
+def check_moves_array(game, player, moves):
+    """Return an int8 array with the status code FocusGame.play would give each candidate move for player 0 or 1
+    of game, leaving out the turn check, without playing any.  moves is either a 1-D array of encoded moves
+    (domination.encode_move, reserve placements included) or an (n, 5) array of stack moves, one row of source row,
+    source column, destination row, destination column and number of pieces per move."""
+    moves = np.asarray(moves, dtype=np.int64)
+    if (moves.ndim == 2):
+        origin = _squares(moves[:, 0], moves[:, 1])
+        target = _squares(moves[:, 2], moves[:, 3])
+        num_pieces = moves[:, 4]
+        reserve_move = np.zeros(len(moves), dtype=bool)
+    else:
+        origin = moves & _SQUARE_MASK
+        target = (moves >> _SQUARE_BITS) & _SQUARE_MASK
+        num_pieces = moves >> _PIECES_SHIFT
+        reserve_move = num_pieces == 0
+
+    # Every candidate reads its source stack from one array of the board, so each source is only looked up once.
+    code = np.array(game._board, dtype=np.int64)[np.minimum(origin, SQUARES - 1)]
+    status = np.full(len(moves), OK, dtype=np.int8)
+    for failed, reason in _location_checks(code, game._colors[player], origin, target, num_pieces):
+        status[~reserve_move & (status == OK) & failed] = reason
+    status[reserve_move & (target >= SQUARES)] = INVALID_LOCATION
+    if (game._reserve[player] == 0):
+        status[reserve_move & (status == OK)] = NO_RESERVE
+    return status
+
+
+def _squares(rows, columns):
+    """Return the square index of each (row, column), or SQUARES and above for positions off the board."""
+    on_board = (rows >= 0) & (rows < BOARD_SIZE) & (columns >= 0) & (columns < BOARD_SIZE)
+    return np.where(on_board, rows * BOARD_SIZE + columns, _SQUARE_MASK)
+
+
+class BatchGame:
+    """N games between the same two players, played in lockstep.  Players are given by index: 0 for player1 and
+    1 for player2.  A turn of -1 means no move has been made yet."""
+
+    def __init__(self, count, player1_color='R'):
+        """Start count games from the initial position.  player1_color is 'R' or 'G'; player2 has the other."""
+        self.count = count
+        self.codes = np.tile(np.array(_INITIAL_BOARD, dtype=np.uint8), (count, 1))     # (N, 36) stack codes
+        self.reserve = np.zeros((count, 2), dtype=np.int16)
+        self.captured = np.zeros((count, 2), dtype=np.int16)
+        self.turn = np.full(count, -1, dtype=np.int8)
+        self.first_move = np.zeros(count, dtype=bool)
+        first = _COLOR_BITS[player1_color]
+        self.colors = np.array([first, 1 - first], dtype=np.int32)                     # colour bit of each player
+        self._rows = np.arange(count)
+
+    def legal_mask(self, players):
+        """Return an (N, len(ALL_MOVES)) boolean array marking the moves each game's player could make, the way
+        FocusGame.legal_moves_encoded lists them."""
+        codes = self.codes.astype(np.int32)
+        color = self.colors[players][:, None]
+        tops = _TOPS[codes][:, _ALL_ORIGINS]
+        heights = _HEIGHTS[codes][:, _ALL_ORIGINS]
+        stack_moves = (tops == color) & (heights >= _ALL_PIECES)
+        has_reserve = (self.reserve[self._rows, players] > 0)[:, None]
+        return np.where(_ALL_PIECES == 0, has_reserve, stack_moves)
+
+    def random_moves(self, players, rng):
+        """Return one legal move per game for the given players, drawn uniformly from the moves legal_mask marks,
+        or -1 where there is none.  rng is a numpy Generator."""
+        codes = self.codes.astype(np.int64)
+        heights = _HEIGHTS[codes]
+        owned = _TOPS[codes] == self.colors[players][:, None]
+
+        # Count the moves out of each square, plus the reserve placements, and pick one of them per game.
+        groups = np.zeros((self.count, SQUARES + 1), dtype=np.int64)
+        groups[:, :SQUARES] = np.where(owned, _MOVE_COUNTS[_SQUARE_INDEX, heights], 0)
+        groups[:, SQUARES] = np.where(self.reserve[self._rows, players] > 0, SQUARES, 0)
+        ends = groups.cumsum(axis=1)
+        total = ends[:, SQUARES]
+        pick = (rng.random(self.count) * total).astype(np.int64)
+        group = (ends > pick[:, None]).argmax(axis=1)
+        offset = pick - ends[self._rows, group] + groups[self._rows, group]
+
+        square = np.minimum(group, SQUARES - 1)
+        stack_move = _MOVE_TABLE[square, heights[self._rows, square], np.minimum(offset, _MOVE_TABLE.shape[2] - 1)]
+        reserve_move = np.array(_RESERVE_MOVES, dtype=np.int64)[np.minimum(offset, SQUARES - 1)]
+        moves = np.where(group < SQUARES, stack_move, reserve_move)
+        return np.where(total > 0, moves, -1)
+
+    def winners(self):
+        """Return the index of each game's winner, or -1 while nobody has reached the winning capture count."""
+        won = self.captured >= WIN_CAPTURES
+        return np.where(won[:, 0], 0, np.where(won[:, 1], 1, -1))
+
+    def step(self, players, moves):
+        """Play moves[i] for players[i] in every game i and return an array of result codes.  A move of -1 skips
+        that game.  Moves use the encoding of domination.encode_move."""
+        players = np.asarray(players, dtype=np.int64)
+        moves = np.asarray(moves, dtype=np.int64)
+        rows = self._rows
+        status = np.full(self.count, OK, dtype=np.int8)
+        skipped = moves < 0
+        moves = np.where(skipped, 0, moves)
+        status[skipped] = SKIPPED
+
+        origin = moves & _SQUARE_MASK
+        target = (moves >> _SQUARE_BITS) & _SQUARE_MASK
+        num_pieces = moves >> _PIECES_SHIFT
+        reserve_move = ~skipped & (num_pieces == 0)
+        stack_move = ~skipped & (num_pieces > 0)
+        color = self.colors[players]
+
+        # move_piece: the first move of a game fixes the turn, after which a player may not move twice in a row.
+        starting = stack_move & (self.turn == -1)
+        self.turn[starting] = players[starting]
+        self.first_move[starting] = True
+        status[stack_move & (self.turn == players) & ~self.first_move] = NOT_YOUR_TURN
+
+        # locationCheck, in the same order, only for games still marked OK.
+        code = self.codes[rows, np.minimum(origin, SQUARES - 1)].astype(np.int64)
+        height = _HEIGHTS[code]
+        for failed, reason in _location_checks(code, color, origin, target, num_pieces):
+            status[stack_move & (status == OK) & failed] = reason
+
+        # reserved_move.
+        status[reserve_move & (target >= SQUARES)] = INVALID_LOCATION
+        status[reserve_move & (status == OK) & (self.reserve[rows, players] == 0)] = NO_RESERVE
+
+        # Cut the moving pieces off each source stack, then read the targets, which may be the same squares.
+        moving = np.flatnonzero(stack_move & (status == OK))
+        keep = height[moving] - num_pieces[moving]
+        source_code = code[moving]
+        self.codes[moving, origin[moving]] = (source_code & ((1 << keep) - 1)) | (1 << keep)
+
+        placing = np.flatnonzero(reserve_move & (status == OK))
+        played = np.concatenate((moving, placing))
+        squares = target[played]
+        below = self.codes[played, squares].astype(np.int64)
+        below_height = _HEIGHTS[below]
+        pieces = np.concatenate((source_code >> keep, 2 | color[placing]))
+        stack = (below ^ (1 << below_height)) | (pieces << below_height)
+
+        # Trim stacks above the limit: the mover keeps their own colour as reserve and captures the rest.
+        extra = np.maximum(_HEIGHTS[stack] - STACK_LIMIT, 0)
+        greens = _GREEN_COUNTS[stack & ((1 << extra) - 1)]
+        mover = players[played]
+        own = np.where(color[played] == 1, greens, extra - greens)
+        self.reserve[played, mover] += (own - np.concatenate((np.zeros(len(moving), dtype=np.int64),
+                                                              np.ones(len(placing), dtype=np.int64)))
+                                        ).astype(np.int16)
+        self.captured[played, mover] += (extra - own).astype(np.int16)
+        self.codes[played, squares] = stack >> extra
+
+        self.turn[played] = mover
+        self.first_move[played] = False
+        return status
+
+    def game(self, index, player1=('Player1', 'R'), player2=('Player2', 'G')):
+        """Return game index as a FocusGame with the given player tuples, whose colours must match the batch."""
+        game = FocusGame(player1, player2)
+        game._board = [int(code) for code in self.codes[index]]
+        game._reserve = [int(count) for count in self.reserve[index]]
+        game._captured = [int(count) for count in self.captured[index]]
+        turn = int(self.turn[index])
+        game.turn = None if turn == -1 else (player1, player2)[turn][0]
+        game.firstMove = bool(self.first_move[index]) if turn != -1 else None
+        game._hash = game._compute_hash() ^ game._turn_key()
+        game._recount()
+        return game
+
+
+def differential_check(games=64, plies=200, seed=0, noise=0.2):
+    """Play random games in a BatchGame and in one FocusGame per game and raise AssertionError at the first
+    difference in board, reserves, captured counts or turn.  A share of the moves given by noise are random
+    encodings, so rejected moves are compared too."""
+    players = (('Player1', 'R'), ('Player2', 'G'))
+    batch = BatchGame(games)
+    reference = [FocusGame(*players) for game in range(games)]
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    to_move = np.zeros(games, dtype=np.int64)
+
+    for ply in range(plies):
+        moves = batch.random_moves(to_move, rng)
+        for index in range(games):
+            if (picker.random() < noise):
+                moves[index] = picker.randrange(1 << (_PIECES_SHIFT + 3))
+        batch.step(to_move, moves)
+
+        for index, game in enumerate(reference):
+            if (moves[index] >= 0):
+                name = players[to_move[index]][0]
+                move = int(moves[index])
+                origin = move & _SQUARE_MASK
+                target = (move >> _SQUARE_BITS) & _SQUARE_MASK
+                source = divmod(origin, BOARD_SIZE)
+                destination = divmod(target, BOARD_SIZE)
+                num_pieces = move >> _PIECES_SHIFT
+                if (num_pieces == 0):
+                    game.reserved_move(name, destination)
+                else:
+                    game.move_piece(name, source, destination, num_pieces)
+            expected = (game._board, game._reserve, game._captured, game.turn, game.firstMove)
+            mirror = batch.game(index, *players)
+            actual = (mirror._board, mirror._reserve, mirror._captured, mirror.turn, mirror.firstMove)
+            if (expected != actual):
+                raise AssertionError('game %d differs after ply %d' % (index, ply))
+        to_move = 1 - to_move
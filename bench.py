@@ -0,0 +1,360 @@
+# Description: Repeatable benchmarks for FocusGame's hot paths.  Three fixed-seed corpora of recorded calls (the
+#               opening, a capture-heavy midgame and a reserve-heavy endgame) are replayed against move_piece,
+#               locationCheck, move_piece_finalized, updateScores, reserved_move and the integer API's play.  For
+#               each the suite reports calls per second, per-call latency percentiles and, through tracemalloc, the
+#               memory allocated per call.  Results are saved as JSON and can be compared against an earlier run,
+#               flagging any regression above a threshold.
+#
+#               --against replays the same corpora through move_piece and reserved_move of another domination.py,
+#               such as the original list-based one, which has neither legal_moves nor encode_move to build them,
+#               taking turns with this one so that both see the same machine load.
+#
+#               python bench.py --out bench.json
+#               python bench.py --out new.json --compare bench.json --threshold 0.10
+#               python bench.py --against old/domination.py
+
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from domination import FocusGame, encode_move
+
+PLAYER1 = ('PlayerA', 'R')
+PLAYER2 = ('PlayerB', 'G')
+METHODS = ('move_piece', 'locationCheck', 'move_piece_finalized', 'updateScores', 'reserved_move', 'play')
+
+
+def _choose(game, name, rng, style):
+    """Return the next call for name: ('move', name, source, destination, num_pieces) or
+    ('reserve', name, destination).  style decides which legal moves are preferred."""
+    moves = game.legal_moves(name)
+    if (not moves):
+        return None
+    stack_moves = [move for move in moves if move[0] != "Reserves"]
+    reserve_moves = [move for move in moves if move[0] == "Reserves"]
+
+    if (style == 'endgame' and reserve_moves and rng.random() < 0.6):
+        move = rng.choice(reserve_moves)
+    elif (style in ('midgame', 'endgame') and stack_moves):
+        # Moving whole stacks onto tall stacks is what makes captures happen.
+        sample = rng.sample(stack_moves, min(6, len(stack_moves)))
+        move = max(sample, key=lambda move: move[2] + len(game.show_pieces(move[1])))
+    else:
+        move = rng.choice(moves)
+
+    if (move[0] == "Reserves"):
+        return ('reserve', name, move[1])
+    return ('move', name, move[0], move[1], move[2])
+
+
+def _invalid(rng, name):
+    """Return a random move proposal, most likely one the game rejects."""
+    source = (rng.randrange(6), rng.randrange(6))
+    destination = (rng.randrange(6), rng.randrange(6))
+    return ('move', name, source, destination, rng.randint(1, 5))
+
+
+def build_corpus(kind, games, seed):
+    """Return a corpus: a list of (setup, timed) call lists per game.  setup brings the game to the phase being
+    measured and is replayed untimed; timed is the part that is measured."""
+    rng = random.Random('%s-%d' % (kind, seed))
+    phases = {'opening': (0, 12, 'opening'), 'midgame': (16, 60, 'midgame'), 'endgame': (60, 60, 'endgame')}
+    setup_plies, timed_plies, style = phases[kind]
+    corpus = []
+    for index in range(games):
+        game = FocusGame(PLAYER1, PLAYER2)
+        names = (PLAYER1[0], PLAYER2[0])
+        calls = []
+        for ply in range(setup_plies + timed_plies):
+            name = names[ply % 2]
+            if (ply >= setup_plies and rng.random() < 0.1):
+                proposal = _invalid(rng, name)
+                if (not _is_legal(game, proposal)):
+                    calls.append(proposal)
+            call = _choose(game, name, rng, 'midgame' if ply < setup_plies and kind == 'endgame' else style)
+            if (call is None):
+                break
+            _apply(game, call)
+            calls.append(call)
+        corpus.append((calls[:setup_plies], calls[setup_plies:]))
+    return corpus
+
+
+def _apply(game, call):
+    """Play a recorded call through the public methods."""
+    if (call[0] == 'reserve'):
+        return game.reserved_move(call[1], call[2])
+    return game.move_piece(call[1], call[2], call[3], call[4])
+
+
+def _encode(call):
+    """Return a recorded call as the (player, move) arguments of FocusGame.play."""
+    player = 0 if call[1] == PLAYER1[0] else 1
+    if (call[0] == 'reserve'):
+        return player, encode_move("Reserves", call[2], 1)
+    return player, encode_move(call[2], call[3], call[4])
+
+
+def _color(name):
+    return PLAYER1[1] if name == PLAYER1[0] else PLAYER2[1]
+
+
+def _is_legal(game, call):
+    """Return True if a recorded stack move is one the game would accept now."""
+    return (call[2], call[3], call[4]) in game.legal_moves(call[1])
+
+
+def _time_calls(corpus, method):
+    """Replay the corpus, timing each call of method, and return the list of latencies in nanoseconds."""
+    clock = time.perf_counter_ns
+    latencies = []
+    for setup, timed in corpus:
+        game = FocusGame(PLAYER1, PLAYER2)
+        for call in setup:
+            _apply(game, call)
+
+        # The scoring step behind updateScores runs inside every move, so time it from inside.
+        if (method == 'updateScores'):
+            update = game._update_scores
+
+            def timed_update(*arguments):
+                start = clock()
+                update(*arguments)
+                latencies.append(clock() - start)
+            game._update_scores = timed_update
+        elif (method == 'play'):
+            encoded = [_encode(call) for call in timed]
+
+        for index, call in enumerate(timed):
+            if (method == 'play'):
+                player, move = encoded[index]
+                start = clock()
+                game.play(player, move)
+                latencies.append(clock() - start)
+            elif (method == 'move_piece' and call[0] == 'move'):
+                start = clock()
+                game.move_piece(call[1], call[2], call[3], call[4])
+                latencies.append(clock() - start)
+            elif (method == 'locationCheck' and call[0] == 'move'):
+                start = clock()
+                game.locationCheck(call[1], call[2], call[3], call[4], _color(call[1]))
+                latencies.append(clock() - start)
+            elif (method == 'move_piece_finalized' and call[0] == 'move' and _is_legal(game, call)):
+                start = clock()
+                game.move_piece_finalized(call[1], call[2], call[3], call[4], None)
+                latencies.append(clock() - start)
+            elif (method == 'reserved_move' and call[0] == 'reserve'):
+                start = clock()
+                game.reserved_move(call[1], call[2])
+                latencies.append(clock() - start)
+            else:
+                _apply(game, call)
+    return latencies
+
+
+def _throughput(corpus, low_level=False, game_class=FocusGame):
+    """Return calls per second replaying the timed calls through move_piece / reserved_move, or through play
+    when low_level is set, with no per-call timer in the way.  game_class is the game to replay them in."""
+    games = []
+    for setup, timed in corpus:
+        game = game_class(PLAYER1, PLAYER2)
+        for call in setup:
+            _apply(game, call)
+        games.append((game, [_encode(call) for call in timed] if low_level else timed))
+    calls = 0
+    start = time.perf_counter()
+    for game, timed in games:
+        if (low_level):
+            play = game.play
+            for player, move in timed:
+                play(player, move)
+        else:
+            for call in timed:
+                if (call[0] == 'reserve'):
+                    game.reserved_move(call[1], call[2])
+                else:
+                    game.move_piece(call[1], call[2], call[3], call[4])
+        calls += len(timed)
+    elapsed = time.perf_counter() - start
+    return calls / elapsed if elapsed > 0 else 0.0
+
+
+def _allocations(corpus):
+    """Return (peak bytes allocated during a call, bytes still held after it), averaged per call, measured with
+    tracemalloc over the timed calls."""
+    games = []
+    for setup, timed in corpus:
+        game = FocusGame(PLAYER1, PLAYER2)
+        for call in setup:
+            _apply(game, call)
+        games.append((game, timed))
+
+    transient = 0
+    retained = 0
+    calls = 0
+    tracemalloc.start()
+    try:
+        for game, timed in games:
+            for call in timed:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                _apply(game, call)
+                current, peak = tracemalloc.get_traced_memory()
+                transient += peak - before
+                retained += current - before
+                calls += 1
+    finally:
+        tracemalloc.stop()
+    if (calls == 0):
+        return 0.0, 0.0
+    return transient / calls, retained / calls
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of values fall, by nearest rank."""
+    if (not values):
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(games=40, seed=0, repeat=5):
+    """Run every benchmark and return the results as a dict ready to be saved as JSON.  Latencies are the best of
+    repeat runs at each percentile, to keep noise from other processes down."""
+    results = {}
+    for kind in ('opening', 'midgame', 'endgame'):
+        corpus = build_corpus(kind, games, seed)
+        section = {'calls': sum(len(timed) for setup, timed in corpus)}
+        section['moves_per_second'] = max(_throughput(corpus) for attempt in range(repeat))
+        section['play_moves_per_second'] = max(_throughput(corpus, True) for attempt in range(repeat))
+        transient, retained = _allocations(corpus)
+        section['bytes_allocated_per_move'] = transient
+        section['bytes_retained_per_move'] = retained
+        for method in METHODS:
+            runs = [_time_calls(corpus, method) for attempt in range(repeat)]
+            if (not runs[0]):
+                continue
+            section[method] = {
+                'calls': len(runs[0]),
+                'p50_ns': min(percentile(latencies, 0.50) for latencies in runs),
+                'p90_ns': min(percentile(latencies, 0.90) for latencies in runs),
+                'p99_ns': min(percentile(latencies, 0.99) for latencies in runs),
+                'calls_per_second': max(len(latencies) * 1e9 / max(sum(latencies), 1) for latencies in runs),
+            }
+        results[kind] = section
+
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'games': games,
+            'seed': seed,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def against(path, games=40, seed=0, repeat=5):
+    """Return {corpus kind: (moves per second here, moves per second with the FocusGame of the domination.py at
+    path)}, replaying move_piece and reserved_move in both and taking turns between them."""
+    spec = importlib.util.spec_from_file_location('other_domination', path)
+    other = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(other)
+
+    results = {}
+    for kind in ('opening', 'midgame', 'endgame'):
+        corpus = build_corpus(kind, games, seed)
+        ours = theirs = 0.0
+        for attempt in range(repeat):
+            ours = max(ours, _throughput(corpus))
+            theirs = max(theirs, _throughput(corpus, game_class=other.FocusGame))
+        results[kind] = (ours, theirs)
+    return results
+
+
+def compare(baseline, current, threshold=0.10):
+    """Return a list of regression messages: throughput down, or latency or allocation up, by more than
+    threshold (a fraction) compared to the baseline results."""
+    regressions = []
+
+    def check(label, old, new, higher_is_better):
+        if (not old):
+            return
+        change = (new - old) / old
+        if ((higher_is_better and change < -threshold) or (not higher_is_better and change > threshold)):
+            regressions.append('%s: %.4g -> %.4g (%+.1f%%)' % (label, old, new, 100 * change))
+
+    for kind, old_section in baseline['results'].items():
+        new_section = current['results'].get(kind)
+        if (new_section is None):
+            continue
+        check(kind + ' moves_per_second', old_section['moves_per_second'], new_section['moves_per_second'], True)
+        if ('play_moves_per_second' in old_section and 'play_moves_per_second' in new_section):
+            check(kind + ' play_moves_per_second', old_section['play_moves_per_second'],
+                  new_section['play_moves_per_second'], True)
+        check(kind + ' bytes_allocated_per_move', old_section['bytes_allocated_per_move'],
+              new_section['bytes_allocated_per_move'], False)
+        for method in METHODS:
+            if (method in old_section and method in new_section):
+                for key in ('p50_ns', 'p90_ns'):
+                    check('%s %s %s' % (kind, method, key), old_section[method][key], new_section[method][key],
+                          False)
+    return regressions
+
+
+def report(results):
+    """Return the results as a readable table."""
+    lines = []
+    for kind, section in results['results'].items():
+        lines.append('%s: %.0f moves/s (%.0f through play), %.0f bytes allocated / %.0f retained per move'
+                     % (kind, section['moves_per_second'], section.get('play_moves_per_second', 0),
+                        section['bytes_allocated_per_move'], section['bytes_retained_per_move']))
+        for method in METHODS:
+            if (method in section):
+                stats = section[method]
+                lines.append('    %-22s %6d calls  p50 %6d ns  p90 %6d ns  p99 %6d ns'
+                             % (method, stats['calls'], stats['p50_ns'], stats['p90_ns'], stats['p99_ns']))
+    return '\n'.join(lines)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark FocusGame hot paths.')
+    parser.add_argument('--out', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare against results saved by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown as a fraction')
+    parser.add_argument('--games', type=int, default=40, help='games per corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--against', help='another domination.py to compare move_piece throughput with')
+    options = parser.parse_args(arguments)
+
+    if (options.against):
+        for kind, (ours, theirs) in against(options.against, options.games, options.seed, options.repeat).items():
+            print('%s: %.0f moves/s, %.0f with %s (%.2fx)' % (kind, ours, theirs, options.against, ours / theirs))
+        return 0
+
+    results = run(options.games, options.seed, options.repeat)
+    print(report(results))
+    if (options.out):
+        with open(options.out, 'w') as out:
+            json.dump(results, out, indent=2)
+
+    if (options.compare):
+        with open(options.compare) as baseline:
+            regressions = compare(json.load(baseline), results, options.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if (regressions):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,390 @@
+# Description: Persistent opening book and position cache for FocusGame.  Every game starts from the same position,
+#               so the first moves can be searched once, offline and deeply, and served from disk afterwards.
+#
+#               A book file is the magic bytes b'FOCUSBK' and a version byte, the number of entries as a uint64,
+#               an index of (1 << 16) + 1 uint32s giving, for each top 16 bits of a hash, where its entries start,
+#               and then fixed-size little-endian entries sorted by (hash, move):
+#
+#                 hash     uint64   FocusGame.position_hash of the position
+#                 move     uint16   encoded move (domination.encode_move)
+#                 depth    uint8    depth the move was searched to, 0 if it only comes from game archives
+#                 flag     uint8    transposition.EXACT / LOWER / UPPER for value
+#                 value    int32    search score for the player to move
+#                 games    uint32   archived games in which the move was played from the position
+#                 points   uint32   2 per win and 1 per draw for the player who played it
+#
+#               Readers map the file and look entries up in place, so any number of worker processes share one
+#               copy in the page cache and opening a book costs nothing.  Writers build a new file next to the
+#               old one and rename it over it, so open readers keep a consistent view.  Books are built for
+#               player1 playing red and moving first, as in tournament.py.
+#
+#               A canonical book (magic b'FOCUSBC') is keyed by symmetry.canonical_key instead, with its moves as
+#               they are in the canonical position, so symmetric openings share entries.  Pair it with a
+#               canonical SearchEngine.
+#
+#               python book.py build focus.book --plies 3 --width 4 --time 1.0
+#               python book.py update focus.book games.rec
+#               python book.py merge focus.book other.book --out merged.book
+#               python book.py lookup focus.book
+
+import argparse
+import heapq
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from domination import WIN_CAPTURES, FocusGame, decode_move
+from symmetry import canonical_key, canonical_state, inverse, transform_move
+from transposition import EXACT, TranspositionTable
+
+MAGIC = b'FOCUSBK\x01'
+CANONICAL_MAGIC = b'FOCUSBC\x01'
+DEFAULT_PATH = os.environ.get('FOCUS_BOOK', 'focus.book')
+PLAYERS = (('Player1', 'R'), ('Player2', 'G'))      # players books are built for; player1 moves first
+_PREFIX_BITS = 16
+_PREFIX_SHIFT = 64 - _PREFIX_BITS
+_COUNT = struct.Struct('<Q')
+_INDEX = struct.Struct('<%dI' % ((1 << _PREFIX_BITS) + 1))
+_BOUNDS = struct.Struct('<II')
+_ENTRY = struct.Struct('<QHBBiII')
+_ENTRIES_START = len(MAGIC) + _COUNT.size + _INDEX.size
+
+
+class OpeningBook:
+    """Read-only view of a book file through a memory map.  Entries come back as (move, depth, value, flag,
+    games, points) tuples.  Use as a context manager or call close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if (self.data[:len(MAGIC)] not in (MAGIC, CANONICAL_MAGIC)):
+            self.close()
+            raise ValueError('%s is not a FocusGame book' % path)
+        self.canonical = self.data[:len(MAGIC)] == CANONICAL_MAGIC
+        self.count = _COUNT.unpack_from(self.data, len(MAGIC))[0]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yield every entry as (hash, move, depth, value, flag, games, points), in file order."""
+        for index in range(self.count):
+            key, move, depth, flag, value, games, points = _ENTRY.unpack_from(self.data,
+                                                                              _ENTRIES_START + index * _ENTRY.size)
+            yield key, move, depth, value, flag, games, points
+
+    def entries(self, key):
+        """Return the book's entries for a position hash, one per move, in move order."""
+        data = self.data
+        start, end = _BOUNDS.unpack_from(data, len(MAGIC) + _COUNT.size + 4 * (key >> _PREFIX_SHIFT))
+        found = []
+        for index in range(start, end):
+            entry = _ENTRY.unpack_from(data, _ENTRIES_START + index * _ENTRY.size)
+            if (entry[0] == key):
+                found.append((entry[1], entry[2], entry[4], entry[3], entry[5], entry[6]))
+            elif (entry[0] > key):
+                break
+        return found
+
+    def probe(self, key):
+        """Return (depth, value, flag, move) of the deepest searched entry for the hash, the way
+        TranspositionTable.probe does, or None if the position was never searched."""
+        best = None
+        for move, depth, value, flag, games, points in self.entries(key):
+            if (depth > 0 and (best is None or depth > best[0])):
+                best = (depth, value, flag, move)
+        return best
+
+    def position_entries(self, game):
+        """Return the entries for the game's position with their moves as they are in that position, whichever
+        way the book is keyed."""
+        if (not self.canonical):
+            return self.entries(game.position_hash())
+        key, transform = canonical_key(game)
+        back = inverse(transform)
+        return [(transform_move(entry[0], back),) + entry[1:] for entry in self.entries(key)]
+
+    def choose(self, game, name):
+        """Return the book move for name in the game's position, or None if the book has no legal one.  The
+        deepest searched move is preferred; failing that, the move archived games played most."""
+        entries = self.position_entries(game)
+        if (not entries):
+            return None
+        legal = set(game.legal_moves_encoded(name))
+        entries = [entry for entry in entries if entry[0] in legal]
+        if (not entries):
+            return None
+        return max(entries, key=lambda entry: (entry[1], entry[4], entry[5]))[0]
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BookTable(TranspositionTable):
+    """Transposition table that falls back on a book's search results, so SearchEngine(table=BookTable(book))
+    does not search again what was searched offline."""
+
+    def __init__(self, book, buckets=1 << 16):
+        TranspositionTable.__init__(self, buckets)
+        self.book = book
+
+    def probe(self, key):
+        entry = TranspositionTable.probe(self, key)
+        if (entry is None):
+            entry = self.book.probe(key)
+            if (entry is not None):
+                self.hits += 1
+        return entry
+
+
+def _combined(entries):
+    """Merge neighbouring entries for the same (hash, move) in a sorted stream: the deeper search result is kept
+    and the archive counts are added up."""
+    current = None
+    for entry in entries:
+        if (current is not None and entry[:2] == current[:2]):
+            key, move, depth, value, flag, games, points = current
+            if (entry[2] > depth):
+                depth, value, flag = entry[2], entry[3], entry[4]
+            current = (key, move, depth, value, flag, games + entry[5], points + entry[6])
+        else:
+            if (current is not None):
+                yield current
+            current = entry
+    if (current is not None):
+        yield current
+
+
+def _book_key(game, move, canonical):
+    """Return (hash, move) as a book keyed plainly or canonically stores a move from the game's position."""
+    if (not canonical):
+        return game.position_hash(), move
+    key, transform = canonical_key(game)
+    return key, transform_move(move, transform)
+
+
+def write_book(path, entries, canonical=False):
+    """Write (hash, move, depth, value, flag, games, points) entries, sorted by hash and move, to a book file and
+    return how many were written.  Entries for the same hash and move are combined."""
+    starts = [0] * ((1 << _PREFIX_BITS) + 1)
+    count = 0
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as out:
+        out.write(CANONICAL_MAGIC if canonical else MAGIC)
+        out.seek(_ENTRIES_START)
+        for key, move, depth, value, flag, games, points in _combined(entries):
+            out.write(_ENTRY.pack(key, move, depth, flag, value, games, points))
+            starts[(key >> _PREFIX_SHIFT) + 1] += 1
+            count += 1
+
+        # Turn the per-prefix counts into where each prefix starts, then fill in the header.
+        for prefix in range(1 << _PREFIX_BITS):
+            starts[prefix + 1] += starts[prefix]
+        out.seek(len(MAGIC))
+        out.write(_COUNT.pack(count))
+        out.write(_INDEX.pack(*starts))
+    os.replace(temporary, path)
+    return count
+
+
+def merge_books(paths, out):
+    """Merge book files into out, which may be one of them, and return the number of entries written.  The books
+    are streamed, so memory use does not grow with their size."""
+    books = [OpeningBook(path) for path in paths if os.path.exists(path)]
+    try:
+        canonical = any(book.canonical for book in books)
+        if (not all(book.canonical == canonical for book in books)):
+            raise ValueError('cannot merge canonical and plain books')
+        return write_book(out, heapq.merge(*books), canonical)
+    finally:
+        for book in books:
+            book.close()
+
+
+def _search_position(task):
+    """Search one position for the book and return (hash, best move, depth, score, children), where children are
+    the (state, player to move) pairs to search next.  Run in worker processes."""
+    from search import SearchEngine, evaluate
+    state, player, time_limit, width, canonical = task
+    game = FocusGame.from_state(state, *PLAYERS)
+    name = PLAYERS[player][0]
+    other = PLAYERS[1 - player][0]
+    result = SearchEngine(canonical=canonical).search(game, name, time_limit=time_limit)
+    if (result.encoded_move is None):
+        return game.position_hash(), None, 0, result.score, []
+
+    # Follow the best move and the next best by a one-ply look, to cover what opponents are likely to play.
+    scored = []
+    for move in game.moves(player):
+        game.make(player, move)
+        if (game.captured(player) < WIN_CAPTURES):
+            scored.append((move != result.encoded_move, -evaluate(game, name, other), move))
+        game.unmake_move()
+    scored.sort()
+    children = []
+    for unused, score, move in scored[:width]:
+        game.make(player, move)
+        children.append((game.snapshot(), 1 - player))
+        game.unmake_move()
+    key, move = _book_key(game, result.encoded_move, canonical)
+    return key, move, result.depth, result.score, children
+
+
+def build_book(path, plies=3, width=4, time_limit=1.0, workers=None, progress=None, canonical=False):
+    """Search every position up to plies moves into the game, following the width most promising moves from each,
+    and merge the results into the book at path.  Return the number of positions searched.  A canonical book
+    searches only one position of each symmetric set."""
+    level = [(FocusGame(*PLAYERS).snapshot(), 0)]
+    seen = set()
+    results = []
+    with ProcessPoolExecutor(workers) as pool:
+        for ply in range(plies):
+            tasks = [(state, player, time_limit, width, canonical) for state, player in level]
+            level = []
+            for key, move, depth, score, children in pool.map(_search_position, tasks):
+                if (move is not None):
+                    results.append((key, move, depth, score, EXACT, 0, 0))
+                for state, player in children:
+                    seen_as = canonical_state(state)[0] if canonical else state
+                    if (seen_as not in seen):
+                        seen.add(seen_as)
+                        level.append((state, player))
+            if (progress is not None):
+                progress(ply, len(results))
+
+    results.sort()
+    _merge_into(path, results, canonical)
+    return len(results)
+
+
+def _merge_into(path, entries, canonical):
+    """Merge sorted entries into the book at path, creating it if needed."""
+    if (not os.path.exists(path)):
+        write_book(path, entries, canonical)
+        return
+    with OpeningBook(path) as book:
+        if (book.canonical != canonical):
+            raise ValueError('%s is %s book' % (path, 'a canonical' if book.canonical else 'a plain'))
+        write_book(path, heapq.merge(book, entries), canonical)
+
+
+def update_from_archives(path, archives, plies=16, canonical=None):
+    """Add the first plies moves of every game in the record archives to the book at path, counting how often
+    each move was played from each position and how it went for the player who played it.  Return the number of
+    games read.  Games where player1 has the green pieces are skipped, since book positions assume red.  canonical
+    defaults to what the existing book is, or plain for a new one."""
+    if (canonical is None):
+        canonical = False
+        if (os.path.exists(path)):
+            with OpeningBook(path) as book:
+                canonical = book.canonical
+    from records import PLAYER1_GREEN, RecordReader, _MOVER_SHIFT
+    counts = {}
+    games = 0
+    for archive in archives:
+        with RecordReader(archive) as reader:
+            for flags, start, end in reader:
+                if (flags & PLAYER1_GREEN):
+                    continue
+                game = FocusGame(*PLAYERS)
+                played = []
+                winner = None
+                for move in reader.moves(start, end):
+                    mover = move >> _MOVER_SHIFT
+                    move = move & 0xFFFF
+                    if (len(played) < plies):
+                        played.append(_book_key(game, move, canonical) + (mover,))
+                    game.play(mover, move)
+                    if (game.captured(mover) >= WIN_CAPTURES):
+                        winner = mover
+                        break
+                for key, move, mover in played:
+                    entry = counts.setdefault((key, move), [0, 0])
+                    entry[0] += 1
+                    entry[1] += 1 if winner is None else 2 * (winner == mover)
+                games += 1
+
+    _merge_into(path, [(key, move, 0, 0, EXACT, count[0], count[1]) for (key, move), count in sorted(counts.items())],
+                canonical)
+    return games
+
+
+_open_books = {}
+
+
+def open_book(path=DEFAULT_PATH):
+    """Return the OpeningBook at path, opened once per process, or None if there is no such file."""
+    if (path not in _open_books):
+        _open_books[path] = OpeningBook(path) if os.path.exists(path) else None
+    return _open_books[path]
+
+
+def book_strategy(game, name, rng):
+    """Tournament strategy: play from the book at $FOCUS_BOOK while it has a move, then a 50 ms search that
+    reuses the book's search results.  Load it as 'book:book_strategy'."""
+    from search import SearchEngine
+    book = open_book()
+    if (book is None):
+        return SearchEngine().search(game, name, time_limit=0.05).encoded_move
+    move = book.choose(game, name)
+    if (move is None):
+        engine = SearchEngine(table=BookTable(book), canonical=book.canonical)
+        move = engine.search(game, name, time_limit=0.05).encoded_move
+    return move
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Build, update, merge and inspect FocusGame opening books.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='search the opening positions into a book')
+    build.add_argument('book')
+    build.add_argument('--plies', type=int, default=3)
+    build.add_argument('--width', type=int, default=4, help='moves followed from each position')
+    build.add_argument('--time', type=float, default=1.0, help='seconds of search per position')
+    build.add_argument('--workers', type=int, default=None)
+    build.add_argument('--canonical', action='store_true', help='key the book by symmetry-canonical position')
+    update = commands.add_parser('update', help='add the openings of record archives to a book')
+    update.add_argument('book')
+    update.add_argument('archives', nargs='+')
+    update.add_argument('--plies', type=int, default=16)
+    update.add_argument('--canonical', action='store_true', help='key a new book by symmetry-canonical position')
+    merge = commands.add_parser('merge', help='merge books into one')
+    merge.add_argument('books', nargs='+')
+    merge.add_argument('--out', required=True)
+    lookup = commands.add_parser('lookup', help='show the entries for a position')
+    lookup.add_argument('book')
+    lookup.add_argument('moves', nargs='*', type=int, help='encoded moves played from the start, player1 first')
+    options = parser.parse_args(arguments)
+
+    if (options.command == 'build'):
+        searched = build_book(options.book, options.plies, options.width, options.time, options.workers,
+                              lambda ply, total: print('ply %d: %d positions searched' % (ply + 1, total)),
+                              options.canonical)
+        print('%d positions added to %s' % (searched, options.book))
+    elif (options.command == 'update'):
+        games = update_from_archives(options.book, options.archives, options.plies, options.canonical or None)
+        print('%d games added to %s' % (games, options.book))
+    elif (options.command == 'merge'):
+        print('%d entries written to %s' % (merge_books(options.books, options.out), options.out))
+    else:
+        game = FocusGame(*PLAYERS)
+        for index, move in enumerate(options.moves):
+            game.play(index % 2, move)
+        with OpeningBook(options.book) as book:
+            print('%d entries, position %016x' % (len(book), game.position_hash()))
+            for move, depth, value, flag, games, points in book.position_entries(game):
+                print('%6d %-28s depth %2d value %8d flag %d games %6d points %6d'
+                      % (move, decode_move(move), depth, value, flag, games, points))
+
+
+if __name__ == '__main__':
+    main()
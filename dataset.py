@@ -0,0 +1,186 @@
+# Description: Columnar position datasets for training evaluation functions.  Positions from self-play are streamed
+#               into shards of a fixed number of rows, each saved as a NumPy structured array in its own .npy file,
+#               one row per position:
+#
+#                 stacks    uint8[36]   packed stack code of every square, row by row, as in FocusGame
+#                 reserve   uint8[2]    reserve counts of player1 and player2
+#                 captured  uint8[2]    captured counts of player1 and player2
+#                 to_move   uint8       0 when player1 is to move, 1 when player2 is
+#                 outcome   int8        1 if the player to move went on to win, -1 if they lost, 0 for a draw
+#                 ply       uint16      number of moves played before the position
+#
+#               The writer holds one shard and the positions of the game in progress, however many games it is
+#               given, and a shard is written next to its final name and renamed into place once complete.  Every
+#               shard is a plain .npy file, so training jobs open it with np.load(path, mmap_mode='r') and read
+#               columns straight from the page cache without parsing anything.
+#
+#               With canonical set, positions are stored in their symmetry-canonical form (symmetry.py), so
+#               symmetric positions give identical rows.  A transform that swaps the players swaps to_move
+#               with them, and the outcome, being for the player to move, stays as it is.
+#
+#               python dataset.py games.rec --out positions --shard-rows 65536
+
+import argparse
+import glob
+import os
+
+import numpy as np
+
+from domination import BOARD_SIZE, WIN_CAPTURES, FocusGame
+from records import PLAYER1_GREEN, RecordReader, _MOVER_SHIFT
+from symmetry import SWAP, canonical_state
+
+DEFAULT_SHARD_ROWS = 1 << 16
+SHARD_PATTERN = 'positions-%05d.npy'
+
+
+def position_dtype(board_size=BOARD_SIZE):
+    """Return the dtype of a dataset row for a board board_size squares across."""
+    return np.dtype([('stacks', np.uint8, (board_size * board_size,)), ('reserve', np.uint8, (2,)),
+                     ('captured', np.uint8, (2,)), ('to_move', np.uint8), ('outcome', np.int8), ('ply', np.uint16)])
+
+
+class DatasetWriter:
+    """Writes positions to numbered shards in a directory.  Add the positions of a game with add, finish it with
+    end_game once its result is known, and close the writer to write the last, partly filled, shard.  Shards
+    already in the directory are kept, and new ones are numbered after them.  Use as a context manager or call
+    close()."""
+
+    def __init__(self, directory, shard_rows=DEFAULT_SHARD_ROWS, board_size=BOARD_SIZE, canonical=False):
+        if (canonical and board_size != BOARD_SIZE):
+            raise ValueError('only positions on the standard %dx%d board can be canonicalised'
+                             % (BOARD_SIZE, BOARD_SIZE))
+        self.directory = directory
+        self.canonical = canonical
+        self.dtype = position_dtype(board_size)
+        self.shards = len(shard_paths(directory))      # number of the next shard
+        self.positions = 0                              # rows added by this writer
+        self._squares = board_size * board_size
+        self._rows = np.zeros(shard_rows, dtype=self.dtype)
+        self._count = 0                                 # rows of the current shard filled so far
+        self._game = []                                 # (snapshot, to_move, ply) of the game in progress
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, game, to_move, ply):
+        """Add the game's current position, with player 0 or 1 to move after ply moves.  It is written once
+        end_game gives the result."""
+        self._game.append((game.snapshot(), to_move, ply))
+
+    def end_game(self, winner):
+        """Finish the game in progress: winner is the index of the player who won, or None for a draw."""
+        positions = self._game
+        self._game = []
+        if (not positions):
+            return
+        to_move = np.array([player for state, player, ply in positions], dtype=np.uint8)
+        plies = np.array([ply for state, player, ply in positions], dtype=np.uint16)
+        if (winner is None):
+            outcome = np.zeros(len(positions), dtype=np.int8)
+        else:
+            outcome = np.where(to_move == winner, 1, -1).astype(np.int8)
+
+        states = [state for state, player, ply in positions]
+        if (self.canonical):
+            for index, state in enumerate(states):
+                states[index], transform = canonical_state(state)
+                if (transform & SWAP):
+                    to_move[index] ^= 1
+        states = np.frombuffer(b''.join(states), dtype=np.uint8).reshape(len(positions), -1)
+        squares = self._squares
+
+        # Copy the game into the shard, writing it out each time it fills up.
+        done = 0
+        while (done < len(positions)):
+            count = min(len(positions) - done, len(self._rows) - self._count)
+            rows = self._rows[self._count:self._count + count]
+            block = states[done:done + count]
+            rows['stacks'] = block[:, :squares]
+            rows['reserve'] = block[:, squares:squares + 2]
+            rows['captured'] = block[:, squares + 2:squares + 4]
+            rows['to_move'] = to_move[done:done + count]
+            rows['outcome'] = outcome[done:done + count]
+            rows['ply'] = plies[done:done + count]
+            self._count += count
+            done += count
+            if (self._count == len(self._rows)):
+                self._write_shard()
+        self.positions += len(positions)
+
+    def _write_shard(self):
+        """Write the filled rows of the current shard and start the next one."""
+        path = os.path.join(self.directory, SHARD_PATTERN % self.shards)
+        with open(path + '.tmp', 'wb') as shard:
+            np.save(shard, self._rows[:self._count])
+        os.replace(path + '.tmp', path)
+        self.shards += 1
+        self._count = 0
+
+    def close(self):
+        """Write the last shard.  The positions of a game that was never ended are dropped."""
+        self._game = []
+        if (self._count):
+            self._write_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shard_paths(directory):
+    """Return the paths of the shards in a dataset directory, in order."""
+    return sorted(glob.glob(os.path.join(glob.escape(directory), SHARD_PATTERN.replace('%05d', '[0-9]' * 5))))
+
+
+def open_shard(path):
+    """Return the rows of a shard as a read-only structured array mapped from the file."""
+    return np.load(path, mmap_mode='r')
+
+
+def read_dataset(directory):
+    """Yield the rows of every shard in a dataset directory, each mapped from its file."""
+    for path in shard_paths(directory):
+        yield open_shard(path)
+
+
+def export_archives(directory, archives, shard_rows=DEFAULT_SHARD_ROWS, canonical=False):
+    """Replay every game in the record archives and write every position before each move to the dataset in
+    directory, with the game's result.  A game ends when a player reaches WIN_CAPTURES, and is won by the last
+    player to move when the other has no move left, as in tournament.py.  Return the number of positions written."""
+    with DatasetWriter(directory, shard_rows, canonical=canonical) as writer:
+        for archive in archives:
+            with RecordReader(archive) as reader:
+                for flags, start, end in reader:
+                    if (flags & PLAYER1_GREEN):
+                        game = FocusGame(('Player1', 'G'), ('Player2', 'R'))
+                    else:
+                        game = FocusGame(('Player1', 'R'), ('Player2', 'G'))
+                    winner = None
+                    mover = None
+                    for ply, move in enumerate(reader.moves(start, end)):
+                        mover = move >> _MOVER_SHIFT
+                        writer.add(game, mover, ply)
+                        game.play(mover, move & 0xFFFF)
+                        if (game.captured(mover) >= WIN_CAPTURES):
+                            winner = mover
+                            break
+                    if (winner is None and mover is not None and not game.moves(1 - mover)):
+                        winner = mover
+                    writer.end_game(winner)
+        return writer.positions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Export the positions of archived games as a training dataset.')
+    parser.add_argument('archives', nargs='+', help='record archives written by records.RecordWriter')
+    parser.add_argument('--out', required=True, help='dataset directory; new shards are added after existing ones')
+    parser.add_argument('--shard-rows', type=int, default=DEFAULT_SHARD_ROWS, help='positions per shard')
+    parser.add_argument('--canonical', action='store_true', help='store positions in symmetry-canonical form')
+    options = parser.parse_args(arguments)
+    positions = export_archives(options.out, options.archives, options.shard_rows, options.canonical)
+    print('%d positions written to %s' % (positions, options.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,241 +3,899 @@
 #               on a stack and the bottom piece belongs to the opponent.
 #               Players can make moves vertically or horizontally but not diagonally.  Players can make moves with
 #               multiple pieces, and can play pieces from the player's own reserve.
+#
+#               The board is stored as a flat array of 36 small integers, one per square.  Each integer packs a
+#               whole stack: bit i holds the colour of the i-th piece from the bottom (0 for red, 1 for green), and
+#               a single sentinel bit above the top piece marks the height.  An empty square is therefore 1, and a
+#               full stack of five pieces always fits in a byte.  Moving pieces is a couple of shifts and masks
+#               instead of slicing and rebuilding lists.
+#
+#               The board size, stack limit and winning capture count can be changed per game for research on
+#               larger variants.  Every lookup table depends only on the board size and stack limit, so the tables
+#               for each pair are built by _Geometry the first time a game needs them and shared by every game of
+#               that shape.  The module-level tables below are those of the standard 6x6 game, which the other
+#               modules use.
+
+import random
+
+BOARD_SIZE = 6      # Number of rows and columns on the board
+STACK_LIMIT = 5     # Tallest stack allowed before the bottom pieces are removed
+WIN_CAPTURES = 6    # Number of captured pieces that wins the game
+EMPTY = 1           # Packed code of a square with no pieces on it
+MAX_STACK_LIMIT = 7 # Tallest stack limit a snapshot can hold, one byte per stack
+
+_COLORS = ('R', 'G')                # Piece colour for each bit value
+_COLOR_BITS = {'R': 0, 'G': 1}      # Bit value for each piece colour
+
+# Status codes of the low-level move API, and the message the name-based methods return for each.
+OK = 0
+NOT_YOUR_TURN = 1
+INVALID_LOCATION = 2
+INVALID_NUMBER = 3
+NO_RESERVE = 4
+STATUS_MESSAGES = ('successfully moved', 'not your turn', 'invalid location', 'invalid number of pieces',
+                   'no pieces in reserve')
+
+# Seed of the Zobrist keys.  It is the same for every board shape, and fixed so that the same position hashes the
+# same in every process and every run, which lets hashes be stored on disk.
+_ZOBRIST_SEED = 0x466F637573
+
+# Running totals of the board are packed into one integer of 8-bit counters (see _Geometry), counting stacks by top
+# colour, by height and, for full stacks, by the colour at the bottom.  A piece landing on a full stack pushes that
+# bottom piece off, so a full stack with one player's piece at the bottom is a capture threat for the other.
+_FEATURE_BITS = 8
+_FEATURE_MASK = (1 << _FEATURE_BITS) - 1
+_TOP_FEATURE = 0            # counters 0-2: red on top, green on top, empty
+_HEIGHT_FEATURE = 3         # then one counter per height from 0 to the stack limit, then two counters for full
+                            # stacks with red or green at the bottom
+
+_FIRST_MOVE_VALUES = (None, False, True)    # values of firstMove, by the index a snapshot stores
+
+
+def _destinations(square, distance, board_size):
+    """Return the squares in the same row or column as square that are at most distance away, square included."""
+    row = square // board_size
+    column = square % board_size
+    targets = [square]
+    for step in range(1, distance + 1):
+        for target_row, target_column in ((row - step, column), (row + step, column),
+                                          (row, column - step), (row, column + step)):
+            if (0 <= target_row < board_size and 0 <= target_column < board_size):
+                targets.append(target_row * board_size + target_column)
+    return tuple(targets)
+
+
+class _Geometry:
+    """Lookup tables for one board size and stack limit.  Build them with _geometry, which keeps one per shape."""
+
+    def __init__(self, board_size, stack_limit):
+        # Counts of pieces and squares have to fit in the bytes of a snapshot and the 8-bit board counters.
+        if (not 2 <= board_size <= 15):
+            raise ValueError('board size must be between 2 and 15')
+        if (not 1 <= stack_limit <= MAX_STACK_LIMIT):
+            raise ValueError('stack limit must be between 1 and %d' % MAX_STACK_LIMIT)
+        self.board_size = board_size
+        self.stack_limit = stack_limit
+        square_count = board_size * board_size
+        self.square_count = square_count
+
+        # A move can stack at most two full stacks on one square before it is trimmed, so every code that can ever
+        # exist is below 1 << (2 * stack_limit + 1).  Height, top colour and green count are looked up instead of
+        # computed.
+        code_count = 1 << (2 * stack_limit + 1)
+        height = [code.bit_length() - 1 for code in range(code_count)]
+        self.height = height
+        self.top = [(code >> (height[code] - 1)) & 1 if height[code] > 0 else None for code in range(code_count)]
+        self.greens = [bin(code).count('1') for code in range(code_count)]
+        self.pieces = [tuple(_COLORS[(code >> i) & 1] for i in range(height[code]))
+                       for code in range(1 << (stack_limit + 1))]
+
+        # Packed code of each square at the start of the game, row by row: pairs of red and green pieces, shifted
+        # by a pair on every other row (RRGGRR / GGRRGG on the standard board).
+        self.initial_board = [2 | ((row + column // 2) & 1)
+                              for row in range(board_size) for column in range(board_size)]
+
+        # Moves are encoded as integers: the low square_bits hold the source square, the next square_bits the
+        # destination square and the bits above hold the number of pieces.  A reserve placement has zero pieces
+        # and only a destination square.  square_bits leaves room for off_board, which is not a square: 6 bits on
+        # the standard board.
+        square_bits = square_count.bit_length()
+        self.square_bits = square_bits
+        self.square_mask = (1 << square_bits) - 1
+        self.pieces_shift = 2 * square_bits
+        self.off_board = self.square_mask
+
+        # Row and column of every square index, and the square index of every (row, column) tuple on the board,
+        # for converting many positions at once.  A source of "Reserves" maps to None.
+        self.squares = [(square // board_size, square % board_size) for square in range(square_count)]
+        self.square_index = {position: square for square, position in enumerate(self.squares)}
+        self.source_index = dict(self.square_index, Reserves=None)
+
+        # distance[origin][target] is how far apart two squares in the same row or column are.  Targets in neither,
+        # or off the board, are further than any stack can move.
+        self.distance = [
+            [abs(origin - target) // (1 if origin // board_size == target // board_size else board_size)
+             if target < square_count and (origin // board_size == target // board_size
+                                           or origin % board_size == target % board_size)
+             else square_count
+             for target in range(self.square_mask + 1)]
+            for origin in range(square_count)
+        ]
+
+        # destinations[square][n] lists the squares a stack of n pieces can reach from square.  locationCheck
+        # allows any orthogonal destination no further away than the number of pieces moved, including the source
+        # square itself.  stack_moves[square][height] lists every encoded move out of a stack of that height, for 1
+        # to height pieces.
+        self.destinations = [
+            [_destinations(square, distance, board_size) for distance in range(stack_limit + 1)]
+            for square in range(square_count)
+        ]
+        self.stack_moves = [
+            [
+                tuple(
+                    square | (target << square_bits) | (num_pieces << self.pieces_shift)
+                    for num_pieces in range(1, height_ + 1)
+                    for target in self.destinations[square][num_pieces]
+                )
+                for height_ in range(stack_limit + 1)
+            ]
+            for square in range(square_count)
+        ]
+
+        # Every encoded reserve placement, one per square, and the decoded tuple of every encoded move.
+        self.reserve_moves = tuple(target << square_bits for target in range(square_count))
+        self.decoded = {move: self.decode_move(move) for moves in self.stack_moves for height_ in moves
+                        for move in height_}
+        self.decoded.update((move, self.decode_move(move)) for move in self.reserve_moves)
+
+        # Zobrist keys.  A position's hash is the XOR of one key per square for the stack on it, one key per player
+        # for each of their reserve and captured counts, and keys for whose turn it is.  No counter can go above
+        # the number of pieces in the game.
+        zobrist_random = random.Random(_ZOBRIST_SEED)
+        self.zobrist_stacks = [[zobrist_random.getrandbits(64) for code in range(1 << (stack_limit + 1))]
+                               for square in range(square_count)]
+        self.zobrist_reserve = [[zobrist_random.getrandbits(64) for count in range(square_count + 1)]
+                                for player in range(2)]
+        self.zobrist_captured = [[zobrist_random.getrandbits(64) for count in range(square_count + 1)]
+                                 for player in range(2)]
+        self.zobrist_turn = [zobrist_random.getrandbits(64) for player in range(2)]
+        self.zobrist_first_move = zobrist_random.getrandbits(64)
+
+        # Hash of the starting position, which every new game begins with.
+        initial_hash = (self.zobrist_reserve[0][0] ^ self.zobrist_reserve[1][0] ^ self.zobrist_captured[0][0]
+                        ^ self.zobrist_captured[1][0])
+        for square, code in enumerate(self.initial_board):
+            initial_hash ^= self.zobrist_stacks[square][code]
+        self.initial_hash = initial_hash
+
+        # features[code] holds a 1 in the counter of the colour on top (or of empty squares), of the stack's height
+        # and, for a full stack, of the colour at its bottom.  feature_change[old][new] is what a square changing
+        # from stack old to stack new adds to the counters.
+        self.bottom_feature = _HEIGHT_FEATURE + stack_limit + 1
+        self.features = [
+            (1 << (_FEATURE_BITS * (_TOP_FEATURE + (2 if self.top[code] is None else self.top[code]))))
+            + (1 << (_FEATURE_BITS * (_HEIGHT_FEATURE + height[code])))
+            + ((1 << (_FEATURE_BITS * (self.bottom_feature + (code & 1)))) if height[code] == stack_limit else 0)
+            for code in range(1 << (stack_limit + 1))
+        ]
+        self.feature_change = [[new - old for new in self.features] for old in self.features]
+        self.initial_features = sum(self.features[code] for code in self.initial_board)
+
+        # Layout of the bytes returned by snapshot: one stack code per square, the reserve and captured counts of
+        # player1 and player2, who moved last (0 for nobody yet, otherwise 1 + player index), firstMove as an index
+        # into _FIRST_MOVE_VALUES with the winner above it in bits 2-3 (see snapshot), and the 8-byte little-endian
+        # hash so restoring does not have to recompute it.
+        self.state_counts = square_count
+        self.state_turn = square_count + 4
+        self.state_hash = self.state_turn + 2
+        self.state_size = self.state_hash + 8
+
+    def square(self, position):
+        """Return the square index of a (row, column) position, or off_board if it is not on the board."""
+        row = position[0]
+        column = position[1]
+        if (row < 0 or column < 0 or row >= self.board_size or column >= self.board_size):
+            return self.off_board
+        return row * self.board_size + column
+
+    def encode_move(self, source, destination, num_pieces):
+        """Return the integer encoding of a stack move, or of a reserve placement when source is "Reserves"."""
+        target = destination[0] * self.board_size + destination[1]
+        if (source == "Reserves"):
+            return target << self.square_bits
+        return ((source[0] * self.board_size + source[1]) | (target << self.square_bits)
+                | (num_pieces << self.pieces_shift))
+
+    def decode_move(self, move):
+        """Return the (source, destination, num_pieces) tuple of an encoded move.  Reserve placements come back as
+        ("Reserves", destination, 1), the same way move_piece_finalized is called for them."""
+        num_pieces = move >> self.pieces_shift
+        destination = self.squares[(move >> self.square_bits) & self.square_mask]
+        if (num_pieces == 0):
+            return ("Reserves", destination, 1)
+        return (self.squares[move & self.square_mask], destination, num_pieces)
+
+
+_GEOMETRIES = {}
+
+
+def _geometry(board_size, stack_limit):
+    """Return the shared tables for a board size and stack limit, building them the first time."""
+    geometry = _GEOMETRIES.get((board_size, stack_limit))
+    if (geometry is None):
+        geometry = _GEOMETRIES[board_size, stack_limit] = _Geometry(board_size, stack_limit)
+    return geometry
+
+
+# The tables of the standard game under their own names.
+_STANDARD = _geometry(BOARD_SIZE, STACK_LIMIT)
+_CODE_COUNT = len(_STANDARD.height)
+_HEIGHT = _STANDARD.height
+_TOP = _STANDARD.top
+_GREENS = _STANDARD.greens
+_PIECES = _STANDARD.pieces
+_INITIAL_BOARD = _STANDARD.initial_board
+_SQUARE_BITS = _STANDARD.square_bits
+_SQUARE_MASK = _STANDARD.square_mask
+_PIECES_SHIFT = _STANDARD.pieces_shift
+_SQUARE_COUNT = _STANDARD.square_count
+_SQUARES = _STANDARD.squares
+_OFF_BOARD = _STANDARD.off_board
+_SQUARE_INDEX = _STANDARD.square_index
+_SOURCE_INDEX = _STANDARD.source_index
+_DISTANCE = _STANDARD.distance
+_DESTINATIONS = _STANDARD.destinations
+_STACK_MOVES = _STANDARD.stack_moves
+_RESERVE_MOVES = _STANDARD.reserve_moves
+_DECODED = _STANDARD.decoded
+_MAX_COUNT = _SQUARE_COUNT
+_ZOBRIST_STACKS = _STANDARD.zobrist_stacks
+_ZOBRIST_RESERVE = _STANDARD.zobrist_reserve
+_ZOBRIST_CAPTURED = _STANDARD.zobrist_captured
+_ZOBRIST_TURN = _STANDARD.zobrist_turn
+_ZOBRIST_FIRST_MOVE = _STANDARD.zobrist_first_move
+_INITIAL_HASH = _STANDARD.initial_hash
+_BOTTOM_FEATURE = _STANDARD.bottom_feature
+_FEATURES = _STANDARD.features
+_FEATURE_CHANGE = _STANDARD.feature_change
+_INITIAL_FEATURES = _STANDARD.initial_features
+_STATE_COUNTS = _STANDARD.state_counts
+_STATE_TURN = _STANDARD.state_turn
+_STATE_HASH = _STANDARD.state_hash
+_STATE_SIZE = _STANDARD.state_size
+_square = _STANDARD.square
+encode_move = _STANDARD.encode_move
+decode_move = _STANDARD.decode_move
+
+
+# The tables read on every move, bound to every game as _height, _top and so on, so that reading one costs no more
+# than a global.  The rest are read through FocusGame._geometry.  Keep this list short: CPython stops sharing
+# instance dict keys, and every attribute lookup on the game gets slower, at around 30 attributes.
+_BOUND_TABLES = ('height', 'top', 'distance', 'square_count', 'square_bits', 'square_mask', 'pieces_shift',
+                 'zobrist_stacks', 'feature_change')
+_SHAPE_ATTRIBUTES = frozenset(('_geometry',) + tuple('_' + name for name in _BOUND_TABLES))
+
 
 class FocusGame:
     """FocusGame allows two players to play an abstract game called Focus/Domination, where they can make moves
-    or multiple moves vertically or horizontally, to capture pieces, or place pieces from their reserve."""
+    or multiple moves vertically or horizontally, to capture pieces, or place pieces from their reserve.
+
+    Besides the name-based methods there is a low-level API for engines and simulators that takes the player as an
+    index, 0 for player1 and 1 for player2, and moves encoded as integers (see encode_move): play returns a status
+    code, make / unmake_move play unchecked moves that can be taken back, and moves, reserve and captured read the
+    position.  The name-based methods are thin wrappers over the same code.  Encoded moves depend on the board
+    size, so a game on a board other than the standard one encodes and decodes them with its own encode_move and
+    decode_move methods.
 
-    def __init__(self, player1, player2):
+    Counts of stacks by top colour and by height, capture threats and the winner are kept up to date by every move,
+    so reading them never scans the board.  Callbacks registered with on_capture and on_game_end are called as
+    captures happen, except for moves played with make_move, and any move played while one of those has yet to be
+    taken back."""
+
+    def __init__(self, player1, player2, board_size=BOARD_SIZE, stack_limit=STACK_LIMIT, win_captures=WIN_CAPTURES):
         """Instantiate two players.  Initialize both player's reserve and captured as 0, and set first move as None
-        and initial turn as None.  Place pieces on board in initial state in pattern according to the game."""
+        and initial turn as None.  Place pieces on board in initial state in pattern according to the game.  The
+        board is board_size squares across, stacks are trimmed above stack_limit pieces and capturing win_captures
+        pieces wins."""
+        geometry = _geometry(board_size, stack_limit)
+        self._bind(geometry, stack_limit, win_captures)
+
         self._player1 = player1
         self._player2 = player2
-        self._player1_reserve = 0
-        self._player2_reserve = 0
-        self._player1_captured = 0
-        self._player2_captured = 0
+        self._names = (player1[0], player2[0])
+        self._colors = (_COLOR_BITS[player1[1]], _COLOR_BITS[player2[1]])     # colour bit of each player
+        self._index = {player2[0]: 1, player1[0]: 0}                          # player index of each name
+        self._reserve = [0, 0]          # reserve count of player1 and player2
+        self._captured = [0, 0]         # captured count of player1 and player2
         self.firstMove = None
         self.turn = None
-        self._board = [
-            [['R'], ['R'], ['G'], ['G'], ['R'], ['R']],
-            [['G'], ['G'], ['R'], ['R'], ['G'], ['G']],
-            [['R'], ['R'], ['G'], ['G'], ['R'], ['R']],
-            [['G'], ['G'], ['R'], ['R'], ['G'], ['G']],
-            [['R'], ['R'], ['G'], ['G'], ['R'], ['R']],
-            [['G'], ['G'], ['R'], ['R'], ['G'], ['G']],
-        ]
+        self._board = list(geometry.initial_board)
+        self._undo = []             # one record per make_move that has not been taken back yet
+
+        # Zobrist key of each player's name being the last to move, and the hash of the stacks, reserves and
+        # captured counts.  Moves leave whose turn it is out of _hash, and position_hash adds it when asked, which
+        # keeps two XORs and a lookup off every move.
+        self._turn_keys = {player2[0]: geometry.zobrist_turn[1], player1[0]: geometry.zobrist_turn[0]}
+        self._hash = geometry.initial_hash
+
+        # Packed board counters (see _Geometry.features), index of the first player to reach win_captures, and
+        # callbacks.
+        self._features = geometry.initial_features
+        self._winner = None
+        self._capture_callbacks = []
+        self._game_end_callbacks = []
+
+    def _bind(self, geometry, stack_limit, win_captures):
+        """Set the board shape and bind the shared tables for it, first of all the game's attributes."""
+        self._geometry = geometry
+        self.stack_limit = stack_limit
+        self.win_captures = win_captures
+        for name in _BOUND_TABLES:
+            setattr(self, '_' + name, getattr(geometry, name))
+
+    def __getstate__(self):
+        """Return the game's attributes for pickle and copy without the shared tables, which __setstate__ binds
+        again from the cache, so copies share them and pickles stay small."""
+        state = {name: value for name, value in self.__dict__.items() if name not in _SHAPE_ATTRIBUTES}
+        state['board_size'] = self.board_size
+        return state
+
+    def __setstate__(self, state):
+        """Rebuild a game from the attributes __getstate__ returned, binding the shared tables for its shape."""
+        state = dict(state)
+        stack_limit = state.pop('stack_limit')
+        self._bind(_geometry(state.pop('board_size'), stack_limit), stack_limit, state.pop('win_captures'))
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def board_size(self):
+        """Number of squares across the board."""
+        return self._geometry.board_size
+
+    def play(self, player, move):
+        """Play an encoded move for player 0 (player1) or 1 (player2) and return a status code: OK once it is
+        played, otherwise why it was turned down.  Stack moves follow move_piece and reserve placements follow
+        reserved_move, so a reserve placement is not checked against the turn."""
+        target = (move >> self._square_bits) & self._square_mask
+        num_pieces = move >> self._pieces_shift
+        if (num_pieces == 0):
+            if (target >= self._square_count):
+                return INVALID_LOCATION
+            elif (self._reserve[player] == 0):
+                return NO_RESERVE
+            self._place(player, target)
+            return OK
+        return self._move(player, move & self._square_mask, target, num_pieces)
 
     def move_piece(self, name, source, destination, num_pieces):
         """Move desired number of player's pieces from source to destination on board"""
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
+
+        # Squares are looked up in a dict, falling back to working them out for anything else, such as lists and
+        # squares off the board.
+        geometry = self._geometry
+        try:
+            origin = geometry.square_index[source]
+            target = geometry.square_index[destination]
+        except (KeyError, TypeError):
+            origin = geometry.square(source)
+            target = geometry.square(destination)
+
+        # A move turned down by locationCheck is still reported as moved; play returns the reason.
+        if (self._move(player, origin, target, num_pieces) == NOT_YOUR_TURN):
+            return 'not your turn'
+        return 'successfully moved'
+
+    def _move(self, player, origin, target, num_pieces):
+        """move_piece for a player index and square indexes.  Return a status code."""
+        name = self._names[player]
 
         # If it is the first turn of the game, set turn to name of player and set firstMove to True.
-        if (self.turn == None):
+        if (self.turn is None):
             self.turn = name
             self.firstMove = True
 
-        # If the first player's name is equal to the name of the player moving the piece, set the player's color to
-        # the first player's color.  Otherwise, set color equal to second player's color.
-        if (self._player1[0] == name):
-            playerColor = self._player1[1]
-        else:
-            playerColor = self._player2[1]
-
         # If player who is playing this move is the same as the one who played the previous move,
         # and it is not the first move either, then it is not player's turn.
-        if (self.turn == name and self.firstMove != True):
-            return 'not your turn'
-
-        # Otherwise check if the location the player entered is correct
-        else:
-            self.locationCheck(name, source, destination, num_pieces, playerColor)
-            return 'successfully moved'
-
+        elif (self.turn == name and self.firstMove != True):
+            return NOT_YOUR_TURN
+
+        # Otherwise check if the location the player entered is correct.  A legal move passes every check of _check
+        # at once, so only a move turned down needs _check to say why.
+        if (origin < self._square_count):
+            code = self._board[origin]
+            if (self._top[code] == self._colors[player] and self._height[code] >= num_pieces
+                    and self._distance[origin][target] <= num_pieces):
+                self._finalize(player, origin, target, num_pieces)
+                return OK
+        return self._check(self._colors[player], origin, target, num_pieces)
 
     def locationCheck(self, name, source, destination, num_pieces, playerColor):
         """Check if location the player entered is a valid location.  """
+        origin = self._geometry.square(source)
+        target = self._geometry.square(destination)
+        status = self._check(_COLOR_BITS.get(playerColor), origin, target, num_pieces)
+        if (status != OK):
+            return STATUS_MESSAGES[status]
 
-        row = destination[0]        # row of the destination
-        column = destination[1]     # col of the destination
-        row2 = source[0]            # row of the source
-        column2 = source[1]         # col of the source
+        # Otherwise, move the piece to destination position.
+        self._finalize(self._index[name], origin, target, num_pieces)
+
+    def _check(self, color, origin, target, num_pieces):
+        """Return the status code locationCheck's rules give a move of num_pieces from origin to target for the
+        player with the given colour bit.  Nothing is changed."""
+
+        # If the source square is off the board there is no stack to look at.
+        if (origin >= self._square_count):
+            return INVALID_LOCATION
+
+        code = self._board[origin]      # packed stack on the source square
+        top = self._top[code]           # colour bit of the top piece, None if the square is empty
 
         # If the square you are moving from has no pieces
-        if (len(self._board[row2][column2]) == 0):
-            return 'invalid number of pieces'
+        if (top is None):
+            return INVALID_NUMBER
 
         # If the piece at the top of the stack on that space does not match the player's color
-        elif (self._board[row2][column2][-1] != playerColor):
-            return 'invalid location'
+        elif (top != color):
+            return INVALID_LOCATION
 
         # If the space has less than the number of pieces the player wants to move, player is trying to move an
         # invalid number of pieces
-        elif (len(self._board[row2][column2]) < num_pieces):
-            return 'invalid number of pieces'
-
-        # If the the row or column of the source square is more than 5, or the row or column of the destination
-        # square is more than 5, then the player is moving the piece off the board or from a position not on the board.
-        elif (source[0] > 5 or source[1] > 5 or destination[0] > 5 or destination[1] > 5):
-            return 'invalid location'
-
-        # If the the row or column of the source square is more than , or the row or column of the destination
-        # square is more than , then the player is moving the piece off the board or from a position not on the board.
-        elif (source[0] < 0 or source[1] < 0 or destination[0] < 0 or destination[1] < 0):
-            return 'invalid location'
-
-        # If the piece is trying to move diagonally
-        elif (source[0] != destination[0] and source[1] != destination[1]):
-            return 'invalid location'
-
-        # If the row is the same, but the spaces that the player is trying to move horizontally along the board
-        # is greater than the number of pieces the player is trying to move, the move is invalid
-        elif (source[0] == destination[0] and (abs(source[1] - destination[1]) > num_pieces)):
-            return 'invalid location'
-
-        # If the column is the same, but the spaces that the player is trying to move vertically is greater than the
-        # number of pieces the player is trying to move, the move is invalid
-        elif (source[1] == destination[1] and (abs(source[0] - destination[0]) > num_pieces)):
-            return 'invalid location'
-
-        # If the space has no pieces
-        elif len(self._board[source[0]][source[1]]) == 0:
-            return 'invalid number of pieces '
-
-        # Otherwise, move the piece to destination position.
-        else:
-            self.move_piece_finalized(name, source, destination, num_pieces, None)
+        elif (self._height[code] < num_pieces):
+            return INVALID_NUMBER
+
+        # The destination must be on the board, in the same row or column, and no further away than the number of
+        # pieces moved.  The distance table covers all three.
+        elif (self._distance[origin][target] > num_pieces):
+            return INVALID_LOCATION
+        return OK
+
+    def validate_moves(self, name, candidates):
+        """Return a list with the status code of each (source, destination, num_pieces) candidate for the player:
+        OK for a move locationCheck would accept, otherwise the code of the message it would return.  Candidates from
+        "Reserves" get reserved_move's codes.  Nothing is moved, and whose turn it is is not checked.  Positions must
+        be (row, column) tuples, as legal_moves returns them."""
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
+        sources = self._geometry.source_index
+        squares = self._geometry.square_index
+        off_board = self._geometry.off_board
+        return self._check_many(player, [(sources.get(source, off_board), squares.get(destination, off_board),
+                                          num_pieces) for source, destination, num_pieces in candidates])
+
+    def check_moves(self, player, moves):
+        """Return a list with the status code play would give each encoded move for player 0 or 1, leaving out the
+        turn check.  Nothing is played."""
+        mask = self._square_mask
+        bits = self._square_bits
+        shift = self._pieces_shift
+        return self._check_many(player, [(move & mask if move >> shift else None, (move >> bits) & mask, move >> shift)
+                                         for move in moves])
+
+    def _check_many(self, player, candidates):
+        """Return _check's status code for each (origin, target, num_pieces) candidate, or reserved_move's when the
+        origin is None.  The checks on the source stack are made once per source square, not once per candidate."""
+        board = self._board
+        color = self._colors[player]
+        placed = OK if self._reserve[player] > 0 else NO_RESERVE
+        sources = {}        # height of each source stack seen so far, or minus the status every move from it gets
+        statuses = []
+        for origin, target, num_pieces in candidates:
+            if (origin is None):
+                statuses.append(INVALID_LOCATION if target >= self._square_count else placed)
+                continue
+            height = sources.get(origin)
+            if (height is None):
+                if (origin >= self._square_count):
+                    height = -INVALID_LOCATION
+                else:
+                    code = board[origin]
+                    top = self._top[code]
+                    if (top is None):
+                        height = -INVALID_NUMBER
+                    elif (top != color):
+                        height = -INVALID_LOCATION
+                    else:
+                        height = self._height[code]
+                sources[origin] = height
+            if (height < 0):
+                statuses.append(-height)
+            elif (height < num_pieces):
+                statuses.append(INVALID_NUMBER)
+            elif (self._distance[origin][target] > num_pieces):
+                statuses.append(INVALID_LOCATION)
+            else:
+                statuses.append(OK)
+        return statuses
 
     def move_piece_finalized(self, name, source, destination, num_pieces, player):
-        """Move the piece to the destination after checking that it is a valid move."""
-
-        row = destination[0]        # Row of the destination
-        column = destination[1]     # Column of the destination
-        row2 = source[0]            # Row of the source
-        column2 = source[1]         # Column of the source
-
-        # If player is moving a piece from a source to a destination, that is not from the player's reserves.
+        """Move the piece to the destination after checking that it is a valid move.  A piece placed from
+        "Reserves" is put on the board without taking it out of the player's reserve; reserved_move does that."""
+        square = self._geometry.square
         if (source != "Reserves"):
-            stack = self._board[row2][column2][-num_pieces:]                        # stack of pieces moving from the source
-            self._board[row2][column2] = self._board[row2][column2][:-num_pieces]   # Source square contains the pieces left after stack of pieces is moved by player
-            self._board[row][column].extend(stack)                                  # Add all the elements of the stack of pieces moved by player to the destination square
-            self.firstMove = False
-
-        # If player is playing a piece from the reserve.
+            self._finalize(self._index[name], square(source), square(destination), num_pieces)
         else:
-            self._board[row][column].append(player[1])  # Add a single piece from the player's reserve to the space.
-            self.firstMove = False
-
-        # Set turn to the player that just played the move and update the player's number of reserve and captured pieces.
-        self.turn = name
-        self.updateScores(name, row, row2, column, column2)
+            self._place(self._index[name], square(destination), 0)
         return 'successfully moved'
 
-
-
+    def _finalize(self, player, origin, target, num_pieces):
+        """Move num_pieces from the top of origin onto target for the player, both squares on the board."""
+        board = self._board
+        heights = self._height
+        zobrist = self._zobrist_stacks
+
+        # Cut the source stack below the moving pieces, then read the destination, which may be the same square.
+        code = board[origin]
+        keep = heights[code] - num_pieces                   # number of pieces left behind on the source
+        left = (code & ((1 << keep) - 1)) | (1 << keep)
+        board[origin] = left
+        key = self._hash ^ zobrist[origin][code] ^ zobrist[origin][left]
+        below = board[target]
+        height = heights[below]
+        stack = (below ^ (1 << height)) | ((code >> keep) << height)
+        self.turn = self._names[player]
+        self.firstMove = False
+
+        # Lay the moving pieces, sentinel bit included, on top of the destination stack.  Only a stack over the
+        # limit needs _update_scores.
+        change = self._feature_change
+        if (heights[stack] > self.stack_limit):
+            self._hash = key ^ zobrist[target][below]
+            self._features += change[code][left]
+            self._update_scores(player, target, stack, 0)
+        else:
+            board[target] = stack
+            self._hash = key ^ zobrist[target][below] ^ zobrist[target][stack]
+            self._features += change[code][left] + change[below][stack]
+
+    def _place(self, player, target, reserve=-1):
+        """Place one of the player's pieces on target, which must be on the board, and add reserve to the player's
+        reserve: -1 takes the piece out of it."""
+        below = self._board[target]
+        height = self._height[below]
+        self._hash ^= self._zobrist_stacks[target][below]
+        self.turn = self._names[player]
+        self.firstMove = False
+        self._update_scores(player, target, (below ^ (1 << height)) | ((2 | self._colors[player]) << height),
+                            reserve)
 
     def updateScores(self, name, row, row2, column, column2):
         """Update the player's reserve and captured number of pieces."""
+        square = row * self.board_size + column
+        code = self._board[square]
+        self._hash ^= self._zobrist_stacks[square][code]
+        self._update_scores(self._index[name], square, code, 0)
+
+    def _update_scores(self, player, square, stack, reserve):
+        """Put stack on square, trimmed to the stack limit, and add reserve plus the pieces removed from the bottom
+        to the player's counts.  The hash must not hold any stack on square yet."""
+        extra = self._height[stack] - self.stack_limit      # number of pieces above the stack limit
+
+        # If the space has more than than 5 pieces on it, remove the bottom pieces.  The player keeps their own
+        # colour as reserve and captures the other colour.
+        if (extra > 0):
+            greens = self._geometry.greens[stack & ((1 << extra) - 1)]  # green pieces removed from the bottom
+            own = greens if self._colors[player] else extra - greens
+            stack = stack >> extra
+            captured = extra - own
+            self._add_counts(player, reserve + own, captured)
+        else:
+            captured = 0
+            if (reserve):
+                self._add_counts(player, reserve, 0)
+
+        # Set space to contain only the topmost five pieces of the stack.
+        self._features += self._feature_change[self._board[square]][stack]
+        self._board[square] = stack
+        self._hash ^= self._zobrist_stacks[square][stack]
+
+        # The move is complete, so callbacks see a consistent game.  Moves played with make_move are tried by
+        # engines and taken back, so they call nothing.
+        if (captured and not self._undo):
+            self._notify_capture(player, captured)
+
+    def _notify_capture(self, player, captured):
+        """Call the capture callbacks for captured pieces just taken by player 0 or 1, and the game-end callbacks
+        if they made that player the winner."""
+        name = self._names[player]
+        for callback in self._capture_callbacks:
+            callback(self, name, captured)
+        if (self._winner == player and self._captured[player] - captured < self.win_captures):
+            for callback in self._game_end_callbacks:
+                callback(self, name)
+
+    def _add_counts(self, player, reserve, captured):
+        """Add to player 0 or 1's reserve and captured counts and update the hash to match."""
+        old_reserve = self._reserve[player]
+        old_captured = self._captured[player]
+        self._reserve[player] = old_reserve + reserve
+        self._captured[player] = old_captured + captured
+        keys = self._geometry.zobrist_reserve[player]
+        self._hash ^= keys[old_reserve] ^ keys[old_reserve + reserve]
+
+        # Captures are what ends the game, so this is where the winner is set.
+        if (captured):
+            keys = self._geometry.zobrist_captured[player]
+            self._hash ^= keys[old_captured] ^ keys[old_captured + captured]
+            if (self._winner is None and old_captured + captured >= self.win_captures):
+                self._winner = player
+
+    def _recount(self):
+        """Rebuild the board counters and the winner from the board and captured counts.  When both players have
+        captured win_captures pieces player1 is taken to have won; restore corrects it from the snapshot."""
+        features = self._geometry.features
+        self._features = sum(features[code] for code in self._board)
+        self._winner = None
+        for player in range(2):
+            if (self._captured[player] >= self.win_captures):
+                self._winner = player
+                break
+
+    def _compute_hash(self):
+        """Return the Zobrist hash of the position computed from scratch."""
+        key = 0
+        for square, code in enumerate(self._board):
+            key ^= self._zobrist_stacks[square][code]
+        for player in range(2):
+            key ^= (self._geometry.zobrist_reserve[player][self._reserve[player]]
+                    ^ self._geometry.zobrist_captured[player][self._captured[player]])
+        return key ^ self._turn_key()
+
+    def _turn_key(self):
+        """Return the part of the position's hash that says who moved last and whether it was the first move,
+        which _hash leaves out."""
+        key = self._turn_keys.get(self.turn, 0)
+        if (self.firstMove == True):
+            key ^= self._geometry.zobrist_first_move
+        return key
+
+    def snapshot(self):
+        """Return the position as an immutable, hashable bytes value: stacks, reserves, captured counts, turn,
+        firstMove and, when the captured counts cannot tell, the winner.  The players' names and colours are not part
+        of it.  Undo history is not kept."""
+        turn = self._index.get(self.turn, -1) + 1
+        flags = _FIRST_MOVE_VALUES.index(self.firstMove)
+
+        # Play goes on after a win, and once both players have captured win_captures pieces the counts no longer
+        # say who got there first, so the winner is kept as 1 + player index.  Otherwise it is left at 0, so that
+        # the same position always gives the same bytes.
+        if (self._winner is not None and min(self._captured) >= self.win_captures):
+            flags |= (self._winner + 1) << 2
+        return (bytes(self._board) + bytes((self._reserve[0], self._reserve[1], self._captured[0], self._captured[1],
+                                            turn, flags))
+                + (self._hash ^ self._turn_key()).to_bytes(8, 'little'))
+
+    def restore(self, state):
+        """Put the game back in the position saved by snapshot, dropping any undo history."""
+        geometry = self._geometry
+        counts = geometry.state_counts
+        self._board = list(state[:counts])
+        self._reserve = [state[counts], state[counts + 1]]
+        self._captured = [state[counts + 2], state[counts + 3]]
+        turn = state[geometry.state_turn]
+        self.turn = self._names[turn - 1] if turn else None
+        flags = state[geometry.state_turn + 1]
+        self.firstMove = _FIRST_MOVE_VALUES[flags & 3]
+        self._hash = int.from_bytes(state[geometry.state_hash:geometry.state_size], 'little') ^ self._turn_key()
+        self._undo = []
+        self._recount()
+        if (flags >> 2):
+            self._winner = (flags >> 2) - 1
+
+    @classmethod
+    def from_state(cls, state, player1=('Player1', 'R'), player2=('Player2', 'G'), board_size=BOARD_SIZE,
+                   stack_limit=STACK_LIMIT, win_captures=WIN_CAPTURES):
+        """Return a new game between player1 and player2 in the position saved by snapshot.  The players' colours
+        and the board shape must be the ones the position was played with."""
+        game = cls(player1, player2, board_size, stack_limit, win_captures)
+        game.restore(state)
+        return game
+
+    def copy(self):
+        """Return a new game between the same players on the same board, in the same position.  Undo history and
+        callbacks are not copied."""
+        return self.from_state(self.snapshot(), self._player1, self._player2, self.board_size, self.stack_limit,
+                               self.win_captures)
+
+    def encode_move(self, source, destination, num_pieces):
+        """Return the integer encoding of a move on this game's board (see domination.encode_move)."""
+        return self._geometry.encode_move(source, destination, num_pieces)
+
+    def decode_move(self, move):
+        """Return the (source, destination, num_pieces) tuple of a move encoded for this game's board."""
+        return self._geometry.decoded.get(move) or self._geometry.decode_move(move)
+
+    def position_hash(self):
+        """Return the 64-bit Zobrist hash of the position: stacks, reserves, captured counts and whose turn it is.
+        It is kept up to date by every move, so reading it costs a lookup."""
+        key = self._hash ^ self._turn_keys.get(self.turn, 0)
+        if (self.firstMove == True):
+            key ^= self._geometry.zobrist_first_move
+        return key
+
+    def player_index(self, name):
+        """Return the index the low-level methods use for the named player: 0 for player1, 1 for player2, or None
+        for any other name."""
+        return self._index.get(name)
+
+    def legal_moves(self, name):
+        """Return every move the player can make as (source, destination, num_pieces) tuples.  Reserve placements
+        are listed as ("Reserves", destination, 1).  Whose turn it is is not checked here."""
+        moves = self.legal_moves_encoded(name)
+        if (moves == "INVALID NAME"):
+            return moves
+        decoded = self._geometry.decoded
+        return [decoded[move] for move in moves]
+
+    def legal_moves_encoded(self, name):
+        """Return every move the player can make, encoded as integers (see encode_move)."""
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
+        return self.moves(player)
+
+    def moves(self, player):
+        """Return every encoded move player 0 or 1 can make.  Whose turn it is is not checked here."""
+        color = self._colors[player]
+
+        # Every stack topped by the player's colour can move 1 to all of its pieces along its row or column.
+        moves = []
+        geometry = self._geometry
+        stack_moves = geometry.stack_moves
+        top = self._top
+        height = self._height
+        for square, code in enumerate(self._board):
+            if (top[code] == color):
+                moves.extend(stack_moves[square][height[code]])
+
+        # A piece from the reserve can be placed on any square.
+        if (self._reserve[player] > 0):
+            moves.extend(geometry.reserve_moves)
+        return moves
+
+    def make_move(self, name, move):
+        """Play an encoded move for the player in place, without checking it.  The move should come from
+        legal_moves_encoded.  Push what is needed to take it back onto the undo stack."""
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
+        self.make(player, move)
+
+    def make(self, player, move):
+        """make_move for player 0 or 1."""
+        board = self._board
+        target = (move >> self._square_bits) & self._square_mask
+        num_pieces = move >> self._pieces_shift
+
+        # Save the player's counters along with the squares that will change, then play the move.
+        if (num_pieces):
+            origin = move & self._square_mask
+            self._undo.append((origin, board[origin], target, board[target], player, self._reserve[player],
+                               self._captured[player], self.turn, self.firstMove, self._hash, self._features))
+            self._finalize(player, origin, target, num_pieces)
+        else:
+            self._undo.append((target, board[target], target, board[target], player, self._reserve[player],
+                               self._captured[player], self.turn, self.firstMove, self._hash, self._features))
+            self._place(player, target)
+
+    def unmake_move(self):
+        """Take back the last move played with make_move, restoring the board, counters, turn and firstMove."""
+        (origin, code, target, below, player, reserve, captured, self.turn, self.firstMove, self._hash,
+         self._features) = self._undo.pop()
+        board = self._board
+        board[target] = below
+        board[origin] = code
+        self._reserve[player] = reserve
+        self._captured[player] = captured
+        if (self._winner == player and captured < self.win_captures):
+            self._winner = None
+
+    def opponent(self, name):
+        """Return the name of the other player."""
+        if (self._player1[0] == name):
+            return self._player2[0]
+        elif (self._player2[0] == name):
+            return self._player1[0]
+        else:
+            return "INVALID NAME"
 
-        # If the space has more than than 5 pieces on it, remove the bottom piece.
-        if len(self._board[row][column]) > 5:
-            newStack = self._board[row][column][-5:]                                        # newStack gets the five topmost pieces
-            removedStack = self._board[row][column][:len(self._board[row][column]) - 5]     # removedStack is the pieces that are removed from the bottom of the stack
-            countGreen = removedStack.count('G')                                            # number of green pieces that are removed from the stack
-            countRed = removedStack.count('R')                                              # number of red pieces that are removed form the stack
-
-            # If the name of the player making the move is the same as player1's:
-            if (self._player1[0] == name):
-                color = self._player1[1]            # Set color equal to player1's color
-
-                # If player1 is green and made the move, then add number of removed green piece to player1's reserve,
-                # and add number of removed red piece to player1's captured number of pieces.
-                if color == 'G':
-                    self._player1_reserve = self._player1_reserve + countGreen
-                    self._player1_captured = self._player1_captured + countRed
-
-                # If player1 is red and made the move, then add removed red piece to player1's reserve,
-                # and add number of removed green pieces to player1's captured number of pieces..
-                if color == 'R':
-                    self._player1_reserve = self._player1_reserve + countRed
-                    self._player1_captured = self._player1_captured + countGreen
-
-            # If the name of the player making the move is the same as player2's:
-            if (self._player2[0] == name):
-                color = self._player2[1]            # Set color equal to player2's color
-
-                # If player2 is green and made the move, then add number of removed green piece to player2's reserve,
-                # and add number of removed red piece to player2's captured number of pieces.
-                if color == 'G':
-                    self._player2_reserve = self._player2_reserve + countGreen
-                    self._player2_captured = self._player2_captured + countRed
-
-                # If player2 is red and made the move, then add removed red piece to player2's reserve,
-                # and add number of removed green pieces to player2's captured number of pieces..
-                if color == 'R':
-                    self._player2_reserve = self._player2_reserve + countRed
-                    self._player2_captured = self._player2_captured + countGreen
-
-            # Set space to contain only the topmost five pieces of the stack after removing the bottom pieces.
-            self._board[row][column] = self._board[row][column][-5:]
-
+    def controlled_stacks(self, name):
+        """Return how many stacks have one of the player's pieces on top."""
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
+        return self.controlled(player)
+
+    def controlled(self, player):
+        """Return how many stacks have a piece of player 0 or 1 on top."""
+        return (self._features >> (_FEATURE_BITS * (_TOP_FEATURE + self._colors[player]))) & _FEATURE_MASK
+
+    def stack_heights(self):
+        """Return how many squares hold a stack of each height, from 0 (empty) to the stack limit, as a tuple."""
+        features = self._features >> (_FEATURE_BITS * _HEIGHT_FEATURE)
+        return tuple((features >> (_FEATURE_BITS * height)) & _FEATURE_MASK
+                     for height in range(self.stack_limit + 1))
+
+    def capture_threats(self, player):
+        """Return how many full stacks have an opponent's piece at the bottom, so that player 0 or 1 captures it by
+        landing any piece there."""
+        color = self._colors[1 - player]
+        return (self._features >> (_FEATURE_BITS * (self._geometry.bottom_feature + color))) & _FEATURE_MASK
+
+    def winner(self):
+        """Return the name of the first player to capture win_captures pieces, or None while nobody has."""
+        if (self._winner is None):
+            return None
+        return self._names[self._winner]
+
+    def on_capture(self, callback):
+        """Call callback(game, name, count) every time the named player captures count pieces.  Moves played with
+        make_move are not reported."""
+        self._capture_callbacks.append(callback)
+
+    def on_game_end(self, callback):
+        """Call callback(game, name) when the named player is the first to capture win_captures pieces.  Moves played
+        with make_move are not reported."""
+        self._game_end_callbacks.append(callback)
 
     def show_pieces(self, source):
-        """Return the pieces on that square"""
-        row = source[0]         # row of that square
-        column = source[1]      # col of that square
-        return self._board[row][column]
+        """Return the pieces on that square.  Raise IndexError if the square is not on the board."""
+        square = self._geometry.square(source)
+        if (square == self._geometry.off_board):
+            raise IndexError('square %r is not on the board' % (source,))
+        return list(self._geometry.pieces[self._board[square]])
 
     def show_reserve(self, name):
         """Return how many pieces are in the player's reserve."""
-        if (self._player1[0] == name):
-            return self._player1_reserve
-        elif (self._player2[0] == name):
-            return self._player2_reserve
-        else:
+        player = self._index.get(name)
+        if (player is None):
             return "INVALID NAME"
+        return self._reserve[player]
 
     def show_captured(self, name):
         """Return how many pieces are in that player's captured."""
-        if (self._player1[0] == name):
-            return self._player1_captured
-        elif (self._player2[0] == name):
-            return self._player2_captured
-        else:
+        player = self._index.get(name)
+        if (player is None):
             return "INVALID NAME"
+        return self._captured[player]
 
-    def reserved_move(self, name, source):
-        """Place a piece on the board from a player's reserve."""
-        row = source[0]
-        column = source[1]
-
-        # If name of the player making a reserved move is equal to player1's name.
-        if (self._player1[0] == name):
-
-            # If player1 has no pieces in reserve.
-            if (self._player1_reserve == 0):
-                return 'no pieces in reserve'
+    def reserve(self, player):
+        """Return how many pieces are in the reserve of player 0 or 1."""
+        return self._reserve[player]
 
-            # Otherwise, place piece from player1's reserve onto board, and decrease reserve by 1.
-            else:
-                self.move_piece_finalized(name, "Reserves", source, 1, self._player1)
-                self._player1_reserve = self._player1_reserve - 1
-
-        # If name of the player making a reserved move is equal to player2's name.
-        elif (self._player2[0] == name):
+    def captured(self, player):
+        """Return how many pieces player 0 or 1 has captured."""
+        return self._captured[player]
 
-            # If player2 has no pieces in reserve.
-            if (self._player2_reserve == 0):
-                return 'no pieces in reserve'
+    def reserved_move(self, name, source):
+        """Place a piece on the board from a player's reserve."""
+        geometry = self._geometry
+        try:
+            target = geometry.square_index[source]
+        except (KeyError, TypeError):
+            target = geometry.square(source)
+
+            # If the square is off the board there is nowhere to place the piece.
+            if (target == geometry.off_board):
+                return 'invalid location'
+        player = self._index.get(name)
+        if (player is None):
+            return "INVALID NAME"
 
-            # Otherwise, place piece from player2's reserve onto board, and decrease reserve by 1.
-            else:
-                self.move_piece_finalized(name, "Reserves", source, 1, self._player2)
-                self._player2_reserve = self._player2_reserve - 1
+        # If the player has no pieces in reserve, say so.  Otherwise place one and take it out of the reserve.
+        if (self._reserve[player] == 0):
+            return 'no pieces in reserve'
+        self._place(player, target)
 
     def display_board(self):
-        """Print out the board."""
-        for row in self._board:
-            print(str(row) + '\n')
+        """Print out the board, in one write."""
+        print(''.join(str([self.show_pieces((row, column)) for column in range(self.board_size)]) + '\n\n'
+                      for row in range(self.board_size)), end='')
 
 
 """
@@ -0,0 +1,168 @@
+# Description: Event-sourced move history for FocusGame.  A MoveLog attached to a game records every move the game
+#               plays, straight from the move path (_finalize for stack moves and _place for reserve placements,
+#               which move_piece, reserved_move, locationCheck, move_piece_finalized, play and make all go through),
+#               in an append-only array of encoded moves.  Every interval moves it also keeps a snapshot of the
+#               position as a checkpoint, so seek(k) restores the nearest checkpoint at or before move k and replays
+#               only the moves after it instead of the whole game.  A placement that leaves the reserve alone, which
+#               only move_piece_finalized makes, is logged with origin 1, which no other placement has.
+#
+#               A memory budget caps the checkpoints.  When they outgrow it, every other checkpoint is dropped and
+#               the interval doubles, so memory stays bounded however long the game runs, and a seek never replays
+#               more than interval moves.
+#
+#               The log watches the game by wrapping methods on that instance only, like render.BoardRenderer, so
+#               games without a log run exactly as before.
+
+from array import array
+
+DEFAULT_INTERVAL = 16               # moves between checkpoints
+DEFAULT_BUDGET = 64 * 1024          # bytes of checkpoints kept before the interval doubles
+
+# Methods a log wraps on the game it watches.
+_HOOKS = ('_finalize', '_place', 'unmake_move', 'restore')
+
+
+class MoveLog:
+    """The moves played in one game since the log was attached, with checkpoints for seeking between them."""
+
+    def __init__(self, game, interval=DEFAULT_INTERVAL, max_bytes=DEFAULT_BUDGET):
+        """Start recording game from its current position.  A checkpoint is kept every interval moves, and the
+        checkpoints are thinned out to stay within max_bytes; None means no limit."""
+        if (interval < 1):
+            raise ValueError('checkpoint interval must be at least 1')
+        self.game = game
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.position = 0               # number of logged moves played to reach the game's current position
+        self._moves = array('I')        # encoded move << 1 | player index, in the order played
+        self._checkpoints = [game.snapshot()]       # _checkpoints[i] is the position after i * interval moves
+        self._replaying = False         # set while seek plays logged moves again, which are not recorded twice
+        self._saved = {name: game.__dict__.get(name) for name in _HOOKS}
+        self._attach()
+
+    def _attach(self):
+        game = self.game
+        record = self._record
+        finalize = game._finalize
+        place = game._place
+        unmake_move = game.unmake_move
+        restore = game.restore
+        square_bits = game._square_bits
+        pieces_shift = game._pieces_shift
+
+        def logged_finalize(player, origin, target, num_pieces):
+            finalize(player, origin, target, num_pieces)
+            if (not self._replaying):
+                record(((origin | (target << square_bits) | (num_pieces << pieces_shift)) << 1) | player)
+
+        def logged_place(player, target, reserve=-1):
+            place(player, target, reserve)
+            if (not self._replaying):
+                record((((target << square_bits) | (reserve != -1)) << 1) | player)
+
+        def logged_unmake_move():
+            unmake_move()
+            if (self.position > 0):
+                self._truncate(self.position - 1)
+            else:
+                # A move played before the log started was taken back, so the log now starts here.
+                self._checkpoints[0] = game.snapshot()
+
+        def logged_restore(state):
+            restore(state)
+            if (not self._replaying):
+                self.clear()
+
+        game._finalize = logged_finalize
+        game._place = logged_place
+        game.unmake_move = logged_unmake_move
+        game.restore = logged_restore
+
+    def detach(self):
+        """Stop recording the game, putting back whatever methods it had before.  The log keeps what it has."""
+        for name, method in self._saved.items():
+            if (method is None):
+                self.game.__dict__.pop(name, None)
+            else:
+                self.game.__dict__[name] = method
+
+    def clear(self):
+        """Forget every move and start the log again from the game's current position."""
+        del self._moves[:]
+        self._checkpoints = [self.game.snapshot()]
+        self.position = 0
+
+    def __len__(self):
+        return len(self._moves)
+
+    def _record(self, entry):
+        """Append a move just played.  Moves played after seeking back replace the ones that followed."""
+        if (self.position < len(self._moves)):
+            self._truncate(self.position)
+        self._moves.append(entry)
+        self.position += 1
+        if (self.position % self.interval == 0):
+            self._checkpoints.append(self.game.snapshot())
+            if (self.max_bytes is not None):
+                self._thin()
+
+    def _truncate(self, length):
+        """Drop every move after the first length, and the checkpoints after them."""
+        del self._moves[length:]
+        del self._checkpoints[length // self.interval + 1:]
+        self.position = length
+
+    def _thin(self):
+        """Drop every other checkpoint and double the interval until the checkpoints fit the budget."""
+        checkpoints = self._checkpoints
+        while (len(checkpoints) > 1 and len(checkpoints) * len(checkpoints[0]) > self.max_bytes):
+            del checkpoints[1::2]
+            self.interval *= 2
+
+    @property
+    def checkpoint_bytes(self):
+        """Memory held by the checkpoints, in bytes."""
+        return len(self._checkpoints) * len(self._checkpoints[0])
+
+    def moves(self, start=0, end=None):
+        """Return the logged moves from start to end as (player index, encoded move) tuples."""
+        return [(entry & 1, entry >> 1) for entry in self._moves[start:end]]
+
+    def seek(self, k):
+        """Put the game in the position after the first k logged moves and return the game.  The nearest
+        checkpoint at or before move k is restored and the moves after it are played again, unless the game is
+        already between that checkpoint and move k, when it just plays on.  Everything attached to the game after the
+        log, such as a renderer or profiler, sees the restore and the moves played again.  The game's undo history
+        is dropped, and the capture and game-end callbacks are not called for the moves played again."""
+        if (not 0 <= k <= len(self._moves)):
+            raise IndexError('move %d is not in a log of %d moves' % (k, len(self._moves)))
+        game = self.game
+        start = k - k % self.interval
+        square_bits = game._square_bits
+        square_mask = game._square_mask
+        pieces_shift = game._pieces_shift
+        callbacks = (game._capture_callbacks, game._game_end_callbacks)
+        game._capture_callbacks = []
+        game._game_end_callbacks = []
+        self._replaying = True
+        try:
+            if (not start <= self.position <= k):
+                game.restore(self._checkpoints[k // self.interval])
+                self.position = start
+            finalize = game._finalize
+            place = game._place
+            for entry in self._moves[self.position:k]:
+                player = entry & 1
+                move = entry >> 1
+                target = (move >> square_bits) & square_mask
+                num_pieces = move >> pieces_shift
+                if (num_pieces):
+                    finalize(player, move & square_mask, target, num_pieces)
+                else:
+                    place(player, target, 0 if move & square_mask else -1)
+        finally:
+            self._replaying = False
+            game._capture_callbacks, game._game_end_callbacks = callbacks
+        game._undo = []
+        self.position = k
+        return game
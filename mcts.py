@@ -0,0 +1,203 @@
+# Description: Monte Carlo Tree Search player for FocusGame.  Each worker process grows its own UCT tree from the
+#               same root position with its own random playouts (root parallelisation), and the root statistics
+#               of all trees are added together to pick the move.  Workers receive the position as a small tuple
+#               of numbers and bytes rather than a pickled FocusGame.
+
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from domination import FocusGame, decode_move
+
+EXPLORATION = 1.4           # UCT exploration constant
+PLAYOUT_LIMIT = 80          # plies after which a playout is scored on captured pieces instead of played out
+
+
+def pack_state(game):
+    """Return the players, the board shape and the position as a tuple that is cheap to pickle and send to another
+    process."""
+    return (game._player1, game._player2, game.snapshot(), game.board_size, game.stack_limit, game.win_captures)
+
+
+def unpack_state(state):
+    """Return a new FocusGame in the position saved by pack_state."""
+    return FocusGame.from_state(state[2], state[0], state[1], *state[3:])
+
+
+class Node:
+    """One position in the search tree, reached by playing move for the player named mover."""
+
+    __slots__ = ('move', 'mover', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, mover, parent, untried):
+        self.move = move            # encoded move leading here from the parent
+        self.mover = mover          # name of the player who played it
+        self.parent = parent
+        self.children = []
+        self.untried = untried      # legal moves from here without a child yet
+        self.visits = 0
+        self.wins = 0.0             # playout results from the point of view of mover
+
+    def select(self, exploration):
+        """Return the child with the highest UCT value."""
+        log_visits = math.log(self.visits)
+        best = None
+        best_value = -1.0
+        for child in self.children:
+            value = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if (value > best_value):
+                best = child
+                best_value = value
+        return best
+
+
+def playout(game, name, other, rng, limit=PLAYOUT_LIMIT):
+    """Play random moves starting with name and return the winner's name, or None for a draw, taking every move
+    back afterwards.  A player who cannot move loses; after limit plies the player with more captures wins."""
+    played = 0
+    winner = None
+    win_captures = game.win_captures
+    while (played < limit):
+        moves = game.legal_moves_encoded(name)
+        if (not moves):
+            winner = other
+            break
+        game.make_move(name, moves[rng.randrange(len(moves))])
+        played += 1
+        if (game.show_captured(name) >= win_captures):
+            winner = name
+            break
+        name, other = other, name
+    else:
+        if (game.show_captured(name) > game.show_captured(other)):
+            winner = name
+        elif (game.show_captured(other) > game.show_captured(name)):
+            winner = other
+    for ply in range(played):
+        game.unmake_move()
+    return winner
+
+
+def grow_tree(state, name, iterations, time_limit, seed, exploration=EXPLORATION):
+    """Run MCTS iterations from the packed position with name to move, stopping after iterations playouts or
+    time_limit seconds, and return {move: (visits, wins)} for the root's children."""
+    game = unpack_state(state)
+    rng = random.Random(seed)
+    other = game.opponent(name)
+    root = Node(None, other, None, game.legal_moves_encoded(name))
+    deadline = time.perf_counter() + time_limit if time_limit else None
+    win_captures = game.win_captures
+
+    for iteration in range(iterations):
+        if (deadline is not None and time.perf_counter() > deadline):
+            break
+        node = root
+        played = 0
+
+        # Selection: walk down fully expanded nodes.
+        while (not node.untried and node.children):
+            node = node.select(exploration)
+            game.make_move(node.mover, node.move)
+            played += 1
+
+        # Expansion: add one untried move, unless the game is already over here.
+        to_move = game.opponent(node.mover)
+        if (node.untried and game.show_captured(node.mover) < win_captures):
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            game.make_move(to_move, move)
+            played += 1
+            child = Node(move, to_move, node, None)
+            node.children.append(child)
+            node = child
+            to_move = game.opponent(to_move)
+            if (game.show_captured(node.mover) < win_captures):
+                node.untried = game.legal_moves_encoded(to_move)
+            else:
+                node.untried = []
+
+        # Simulation.
+        if (game.show_captured(node.mover) >= win_captures):
+            winner = node.mover
+        else:
+            winner = playout(game, to_move, node.mover, rng)
+
+        # Backpropagation, taking the moves of this iteration back on the way up.
+        while (node is not None):
+            node.visits += 1
+            if (winner == node.mover):
+                node.wins += 1.0
+            elif (winner is None):
+                node.wins += 0.5
+            node = node.parent
+        for ply in range(played):
+            game.unmake_move()
+
+    return {child.move: (child.visits, child.wins) for child in root.children}
+
+
+class MCTSResult:
+    """Combined root statistics of a parallel search."""
+
+    def __init__(self, move, statistics, elapsed, decode=decode_move):
+        self.encoded_move = move
+        self.move = decode(move) if move is not None else None
+        self.statistics = statistics        # move -> (visits, wins) summed over all workers
+        self.simulations = sum(visits for visits, wins in statistics.values())
+        self.elapsed = elapsed
+
+    @property
+    def simulations_per_second(self):
+        """Return the number of playouts run per second across all workers."""
+        if (self.elapsed <= 0):
+            return 0.0
+        return self.simulations / self.elapsed
+
+    def __repr__(self):
+        return ('MCTSResult(move=%r, simulations=%d, sims/s=%.0f)'
+                % (self.move, self.simulations, self.simulations_per_second))
+
+
+class ParallelMCTS:
+    """Root-parallel MCTS over a pool of worker processes.  The pool is started once and reused for every search;
+    close it with close() or by using the object as a context manager."""
+
+    def __init__(self, workers=None, exploration=EXPLORATION):
+        self.workers = workers or os.cpu_count() or 1
+        self.exploration = exploration
+        self._pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        self._seed = random.Random()
+
+    def search(self, game, name, iterations=10000, time_limit=None):
+        """Return an MCTSResult for name to move.  Every worker runs iterations playouts, or stops at time_limit
+        seconds, and the move with the most visits over all trees is chosen."""
+        start = time.perf_counter()
+        state = pack_state(game)
+        seeds = [self._seed.getrandbits(32) for worker in range(self.workers)]
+        if (self._pool is None):
+            trees = [grow_tree(state, name, iterations, time_limit, seeds[0], self.exploration)]
+        else:
+            futures = [self._pool.submit(grow_tree, state, name, iterations, time_limit, seed, self.exploration)
+                       for seed in seeds]
+            trees = [future.result() for future in futures]
+
+        statistics = {}
+        for tree in trees:
+            for move, (visits, wins) in tree.items():
+                total = statistics.get(move, (0, 0.0))
+                statistics[move] = (total[0] + visits, total[1] + wins)
+        best = max(statistics, key=lambda move: statistics[move][0]) if statistics else None
+        return MCTSResult(best, statistics, time.perf_counter() - start, game.decode_move)
+
+    def close(self):
+        """Shut down the worker processes."""
+        if (self._pool is not None):
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
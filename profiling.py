@@ -0,0 +1,280 @@
+# Description: Opt-in instrumentation for FocusGame.  A Profiler attached to a game replaces the game's methods on
+#               that instance only with timed wrappers, so games it is not attached to run exactly as before and
+#               cost nothing extra.  It counts calls and collects latencies per method, counts rejected moves by the
+#               reason the game gives, and counts captures and won games through FocusGame.on_capture and
+#               on_game_end.  One Profiler can be attached to any number of games, such as every session of a
+#               server, and its figures exported as a dict or as Prometheus text.
+#
+#               Where the time goes inside a move shows up under the internal methods: _check for validation (the
+#               rules behind locationCheck), _finalize and _place for moving stacks (move_piece_finalized) and
+#               _update_scores for trimming stacks and counting captures (updateScores).  Times are inclusive, so a
+#               move_piece call also counts towards the _move, _check and _finalize calls made inside it.
+#
+#               Latencies go into log-scale buckets, four to every doubling, so memory stays fixed however long a
+#               server runs and percentiles come out within 25%.
+#
+#               profile_game turns cProfile on for the calls made on one game only.
+
+import cProfile
+import time
+from contextlib import contextmanager
+
+from domination import OK, STATUS_MESSAGES
+
+# Methods a Profiler times: the name-based entry points, the integer API and the internals they share.
+METHODS = ('move_piece', 'reserved_move', 'locationCheck', 'move_piece_finalized', 'updateScores', 'play', 'make',
+           'unmake_move', 'legal_moves', 'legal_moves_encoded', '_move', '_check', '_finalize', '_place',
+           '_update_scores')
+
+# Methods profile_game runs under cProfile.  Internal methods are only ever called from these.
+PROFILED_METHODS = ('move_piece', 'reserved_move', 'locationCheck', 'move_piece_finalized', 'updateScores', 'play',
+                    'make', 'unmake_move', 'legal_moves', 'legal_moves_encoded', 'moves', 'snapshot', 'restore')
+
+_SUB_BUCKETS = 4            # buckets per doubling of latency
+_BUCKETS = 160              # enough for 2 ** 40 ns, far longer than any call
+
+
+def _bucket(nanoseconds):
+    """Return the latency bucket of a duration: 0-3 for up to 3 ns, then four buckets per doubling."""
+    bits = nanoseconds.bit_length()
+    if (bits <= 2):
+        return nanoseconds
+    return min(_SUB_BUCKETS * (bits - 2) + ((nanoseconds >> (bits - 3)) & 3), _BUCKETS - 1)
+
+
+# _BOUNDS[b] is the longest duration in nanoseconds that falls in bucket b.
+_BOUNDS = []
+for _index in range(_BUCKETS):
+    if (_index < _SUB_BUCKETS):
+        _BOUNDS.append(_index)
+    else:
+        _BOUNDS.append(((_SUB_BUCKETS + _index % _SUB_BUCKETS + 1) << (_index // _SUB_BUCKETS - 1)) - 1)
+
+
+class MethodStats:
+    """Call count, total time and latency histogram of one method."""
+
+    __slots__ = ('calls', 'total_ns', 'buckets')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.buckets = [0] * _BUCKETS
+
+    def add(self, nanoseconds):
+        self.calls += 1
+        self.total_ns += nanoseconds
+        self.buckets[_bucket(nanoseconds)] += 1
+
+    def percentile(self, fraction):
+        """Return the latency in nanoseconds below which the given fraction of calls fall, by nearest rank, as the
+        upper bound of its bucket."""
+        if (self.calls == 0):
+            return 0
+        rank = min(self.calls - 1, int(fraction * self.calls))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if (seen > rank):
+                return _BOUNDS[index]
+        return _BOUNDS[-1]
+
+
+class Profiler:
+    """Counters and latencies gathered from the games it is attached to."""
+
+    def __init__(self, methods=METHODS):
+        self.methods = tuple(methods)
+        self.stats = {name: MethodStats() for name in self.methods}
+        self.rejected = {}          # number of rejected moves by reason
+        self.capture_events = 0     # moves that captured at least one piece
+        self.captured_pieces = 0
+        self.games_won = 0
+        self.games = 0              # games attached so far
+
+    def attach(self, game):
+        """Start instrumenting game and return it."""
+        clock = time.perf_counter_ns
+        for name in self.methods:
+            game.__dict__[name] = self._timed(game, clock, self.stats[name], getattr(game, name), _REJECTIONS.get(name))
+        game.on_capture(self._on_capture)
+        game.on_game_end(self._on_game_end)
+        self.games += 1
+        return game
+
+    def detach(self, game):
+        """Stop instrumenting game.  Its figures stay in the profiler."""
+        for name in self.methods:
+            game.__dict__.pop(name, None)
+        game._capture_callbacks.remove(self._on_capture)
+        game._game_end_callbacks.remove(self._on_game_end)
+
+    def _timed(self, game, clock, stats, method, rejection):
+        """Return method wrapped to add its latency to stats and, with a rejection function, to count the reason
+        rejection finds for a rejected call."""
+        rejected = self.rejected
+
+        if (rejection is None):
+            def timed(*arguments):
+                start = clock()
+                result = method(*arguments)
+                stats.add(clock() - start)
+                return result
+        else:
+            def timed(*arguments):
+                start = clock()
+                result = method(*arguments)
+                stats.add(clock() - start)
+                reason = rejection(game, arguments, result)
+                if (reason is not None):
+                    rejected[reason] = rejected.get(reason, 0) + 1
+                return result
+        return timed
+
+    def _on_capture(self, game, name, count):
+        self.capture_events += 1
+        self.captured_pieces += count
+
+    def _on_game_end(self, game, name):
+        self.games_won += 1
+
+    def reset(self):
+        """Clear every figure gathered so far.  Attached games stay attached."""
+        for stats in self.stats.values():
+            stats.clear()
+        self.rejected.clear()
+        self.capture_events = 0
+        self.captured_pieces = 0
+        self.games_won = 0
+
+    def snapshot(self):
+        """Return the figures as a dict ready to be saved as JSON.  Methods that were never called are left out."""
+        methods = {}
+        for name in self.methods:
+            stats = self.stats[name]
+            if (stats.calls):
+                methods[name] = {
+                    'calls': stats.calls,
+                    'total_ns': stats.total_ns,
+                    'mean_ns': stats.total_ns / stats.calls,
+                    'p50_ns': stats.percentile(0.50),
+                    'p90_ns': stats.percentile(0.90),
+                    'p99_ns': stats.percentile(0.99),
+                }
+        return {
+            'methods': methods,
+            'rejected': dict(self.rejected),
+            'capture_events': self.capture_events,
+            'captured_pieces': self.captured_pieces,
+            'games_won': self.games_won,
+            'games': self.games,
+        }
+
+    def prometheus(self, prefix='focus'):
+        """Return the figures in the Prometheus text exposition format: a latency histogram per method, with a
+        bucket per doubling, and counters for rejected moves, captures and games."""
+        lines = ['# HELP %s_call_seconds Time spent in FocusGame methods.' % prefix,
+                 '# TYPE %s_call_seconds histogram' % prefix]
+        for name in self.methods:
+            stats = self.stats[name]
+            if (not stats.calls):
+                continue
+            cumulative = 0
+            for index, count in enumerate(stats.buckets):
+                cumulative += count
+                if (index % _SUB_BUCKETS == _SUB_BUCKETS - 1 and cumulative):
+                    lines.append('%s_call_seconds_bucket{method="%s",le="%.9g"} %d'
+                                 % (prefix, name, (_BOUNDS[index] + 1) / 1e9, cumulative))
+                if (cumulative == stats.calls):
+                    break
+            lines.append('%s_call_seconds_bucket{method="%s",le="+Inf"} %d' % (prefix, name, stats.calls))
+            lines.append('%s_call_seconds_sum{method="%s"} %.9g' % (prefix, name, stats.total_ns / 1e9))
+            lines.append('%s_call_seconds_count{method="%s"} %d' % (prefix, name, stats.calls))
+
+        lines.append('# HELP %s_rejected_moves_total Moves turned down, by reason.' % prefix)
+        lines.append('# TYPE %s_rejected_moves_total counter' % prefix)
+        for reason, count in sorted(self.rejected.items()):
+            lines.append('%s_rejected_moves_total{reason="%s"} %d' % (prefix, reason, count))
+        for metric, help_text, value in (('capture_events', 'Moves that captured pieces.', self.capture_events),
+                                         ('captured_pieces', 'Pieces captured.', self.captured_pieces),
+                                         ('games_won', 'Games won by reaching the capture target.', self.games_won),
+                                         ('games', 'Games instrumented.', self.games)):
+            lines.append('# HELP %s_%s_total %s' % (prefix, metric, help_text))
+            lines.append('# TYPE %s_%s_total counter' % (prefix, metric))
+            lines.append('%s_%s_total %d' % (prefix, metric, value))
+        return '\n'.join(lines) + '\n'
+
+
+# Rejection functions: given the game, a call's arguments and its result, return the reason it was turned down, or
+# None.  Stack moves are counted in _move, where every entry point's rejections end up; reserve placements in play,
+# and name or location errors where they are caught, so no rejection is counted twice.
+def _move_rejection(game, arguments, status):
+    return STATUS_MESSAGES[status] if status != OK else None
+
+
+def _play_rejection(game, arguments, status):
+    if (status != OK and arguments[1] >> game._pieces_shift == 0):
+        return STATUS_MESSAGES[status]
+    return None
+
+
+def _name_rejection(game, arguments, result):
+    return result if result == "INVALID NAME" else None
+
+
+def _reserved_rejection(game, arguments, result):
+    return result if result in ("INVALID NAME", 'invalid location', 'no pieces in reserve') else None
+
+
+def _location_rejection(game, arguments, result):
+    return result
+
+
+_REJECTIONS = {
+    '_move': _move_rejection,
+    'play': _play_rejection,
+    'move_piece': _name_rejection,
+    'reserved_move': _reserved_rejection,
+    'locationCheck': _location_rejection,
+}
+
+
+@contextmanager
+def profile_game(game, methods=PROFILED_METHODS):
+    """Run cProfile over the calls made on game, and nothing else, while the with block lasts.  Yields the
+    cProfile.Profile, ready for pstats once the block is over:
+
+        with profile_game(game) as profile:
+            play_the_game(game)
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(10)
+    """
+    profile = cProfile.Profile()
+    depth = [0]         # calls into the game in progress, so nested calls do not switch profiling off early
+
+    def profiled(method):
+        def call(*arguments):
+            if (depth[0]):
+                return method(*arguments)
+            depth[0] = 1
+            profile.enable()
+            try:
+                return method(*arguments)
+            finally:
+                profile.disable()
+                depth[0] = 0
+        return call
+
+    saved = {name: game.__dict__.get(name) for name in methods}
+    for name in methods:
+        game.__dict__[name] = profiled(getattr(game, name))
+    try:
+        yield profile
+    finally:
+        for name, method in saved.items():
+            if (method is None):
+                game.__dict__.pop(name, None)
+            else:
+                game.__dict__[name] = method
@@ -0,0 +1,210 @@
+# Description: Compact binary archive of finished FocusGame games.
+#
+#               A file starts with the magic bytes b'FOCUS' and a version byte, followed by the games.  Each game
+#               is one flags byte (bit 0 set when player1 has the green pieces), the length of its move data as a
+#               LEB128 varint, and the moves.  The top bit of a move's first byte says which player made it
+#               (0 for player1) and the next bit whether it is a reserve placement.
+#
+#                 reserve placement, 1 byte:  p 1 dddddd                  d = destination square, 0-35
+#                 stack move, 2 bytes:        p 0 0 nnn ssssss tttt       n = pieces, s = source square,
+#                                                                         t = destination: a column of the
+#                                                                             source row for 0-5, or row t - 6
+#                                                                             of the source column for 6-11
+#
+#               Readers map the file into memory and decode moves with lookup tables straight into the integer
+#               encoding of domination.encode_move, so large archives can be scanned and replayed without loading
+#               them whole or building a tuple per move.
+
+import mmap
+
+from domination import (BOARD_SIZE, OK, STATUS_MESSAGES, FocusGame, decode_move, encode_move, _PIECES_SHIFT,
+                        _SQUARE_BITS, _SQUARE_MASK)
+
+MAGIC = b'FOCUS\x01'
+PLAYER1_GREEN = 1           # game flag: player1 has the green pieces
+_RESERVE_BIT = 0x40
+_MOVER_SHIFT = 16           # the decode tables return move | mover << _MOVER_SHIFT
+
+
+def pack_move(mover, move):
+    """Return the bytes of an encoded move made by mover (0 for player1, 1 for player2)."""
+    target = (move >> _SQUARE_BITS) & _SQUARE_MASK
+    num_pieces = move >> _PIECES_SHIFT
+    if (num_pieces == 0):
+        return bytes(((mover << 7) | _RESERVE_BIT | target,))
+    origin = move & _SQUARE_MASK
+    if (origin // BOARD_SIZE == target // BOARD_SIZE):
+        slot = target % BOARD_SIZE
+    else:
+        slot = BOARD_SIZE + target // BOARD_SIZE
+    word = (mover << 15) | (num_pieces << 10) | (origin << 4) | slot
+    return bytes((word >> 8, word & 0xFF))
+
+
+def _unpack_word(word):
+    """Return move | mover << _MOVER_SHIFT for a two-byte stack move, or -1 if the bits are not a valid move."""
+    num_pieces = (word >> 10) & 0x7
+    origin = (word >> 4) & 0x3F
+    slot = word & 0xF
+    if (num_pieces == 0 or origin >= BOARD_SIZE * BOARD_SIZE or slot >= 2 * BOARD_SIZE or word & 0x2000):
+        return -1
+    row, column = divmod(origin, BOARD_SIZE)
+    if (slot < BOARD_SIZE):
+        target = row * BOARD_SIZE + slot
+    else:
+        target = (slot - BOARD_SIZE) * BOARD_SIZE + column
+    return origin | (target << _SQUARE_BITS) | (num_pieces << _PIECES_SHIFT) | ((word >> 15) << _MOVER_SHIFT)
+
+
+# Decode tables: every possible first byte of a reserve placement, and every possible two-byte stack move.
+_BYTE_MOVES = [((byte & _SQUARE_MASK) << _SQUARE_BITS) | ((byte >> 7) << _MOVER_SHIFT)
+               if byte & _RESERVE_BIT and byte & _SQUARE_MASK < BOARD_SIZE * BOARD_SIZE else -1
+               for byte in range(256)]
+_WORD_MOVES = [_unpack_word(word) for word in range(1 << 16)]
+
+
+def _varint(value):
+    """Return value as LEB128 bytes."""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if (value):
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+class RecordWriter:
+    """Write games to a binary archive one at a time.  Use as a context manager or call close()."""
+
+    def __init__(self, path, append=False):
+        self._file = open(path, 'ab' if append else 'wb')
+        if (self._file.tell() == 0):
+            self._file.write(MAGIC)
+        self.games = 0
+
+    def write_game(self, moves, movers=None, player1_green=False):
+        """Append a game given as a list of encoded moves.  movers lists who made each move (0 for player1, 1 for
+        player2); by default the players alternate starting with player1."""
+        data = bytearray()
+        for index, move in enumerate(moves):
+            mover = index & 1 if movers is None else movers[index]
+            data += pack_move(mover, move)
+        self._file.write(bytes((PLAYER1_GREEN if player1_green else 0,)) + _varint(len(data)))
+        self._file.write(data)
+        self.games += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordReader:
+    """Read a binary archive through a memory map.  Iterating gives (flags, start, end) for each game, where
+    start and end delimit its move bytes in self.data; moves() decodes one game."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if (self.data[:len(MAGIC)] != MAGIC):
+            self.close()
+            raise ValueError('%s is not a FocusGame record file' % path)
+
+    def __iter__(self):
+        data = self.data
+        position = len(MAGIC)
+        size = len(data)
+        while (position < size):
+            flags = data[position]
+            position += 1
+            length = 0
+            shift = 0
+            while True:
+                byte = data[position]
+                position += 1
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                if (not byte & 0x80):
+                    break
+            yield flags, position, position + length
+            position += length
+
+    def moves(self, start, end):
+        """Yield move | mover << 16 for each move between start and end."""
+        data = self.data
+        position = start
+        while (position < end):
+            byte = data[position]
+            if (byte & _RESERVE_BIT):
+                yield _BYTE_MOVES[byte]
+                position += 1
+            else:
+                yield _WORD_MOVES[(byte << 8) | data[position + 1]]
+                position += 2
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def replay(path, callback=None, names=('Player1', 'Player2')):
+    """Replay every game in the archive with play and return the number of games.  callback, if given, is called
+    with (index, game) once each game reaches its final position.  Raise ValueError if a game has a move play turns
+    down."""
+    count = 0
+    with RecordReader(path) as reader:
+        data = reader.data
+        for flags, start, end in reader:
+            if (flags & PLAYER1_GREEN):
+                game = FocusGame((names[0], 'G'), (names[1], 'R'))
+            else:
+                game = FocusGame((names[0], 'R'), (names[1], 'G'))
+
+            # Decode each move straight from the mapped bytes and play it.
+            play = game.play
+            position = start
+            while (position < end):
+                byte = data[position]
+                if (byte & _RESERVE_BIT):
+                    move = _BYTE_MOVES[byte]
+                    position += 1
+                else:
+                    move = _WORD_MOVES[(byte << 8) | data[position + 1]]
+                    position += 2
+                status = play(move >> _MOVER_SHIFT, move & 0xFFFF)
+                if (status != OK):
+                    raise ValueError('game %d has a move turned down: %s' % (count, STATUS_MESSAGES[status]))
+            if (callback is not None):
+                callback(count, game)
+            count += 1
+    return count
+
+
+def convert_jsonl(source, destination):
+    """Write the games of a tournament JSON Lines file to a binary archive and return how many were written."""
+    from tournament import read_results
+    with RecordWriter(destination) as writer:
+        for record in read_results(source):
+            moves = [encode_move(tuple(source_square) if source_square != "Reserves" else source_square,
+                                 destination_square, num_pieces)
+                     for source_square, destination_square, num_pieces in record['moves']]
+            writer.write_game(moves)
+        return writer.games
+
+
+def decode_game(reader, start, end):
+    """Return one game's moves as (mover, (source, destination, num_pieces)) tuples, for inspection."""
+    return [(move >> _MOVER_SHIFT, decode_move(move & 0xFFFF)) for move in reader.moves(start, end)]
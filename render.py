@@ -0,0 +1,180 @@
+# Description: Streaming board renderer for spectators.  A BoardRenderer attached to a game hears about every
+#               square the game changes, straight from the move path (_finalize, _place and _update_scores, which
+#               move_piece_finalized and updateScores go through), and turns them into compact text frames that
+#               list only what changed since the previous frame.  Keyframes with the whole position are made on
+#               demand, for viewers joining late or after a gap in the sequence numbers.
+#
+#               Frames are single lines:
+#
+#                 K 0 R R G G R R ... t=- r=0,0 c=0,0     keyframe: sequence number, every stack row by row,
+#                                                         who moved last, reserves and captured counts
+#                 D 7 1:- 2:GGR t=2 r=0,1                 delta: sequence number, then square:stack for every
+#                                                         changed square, and t=, r= and c= when they changed
+#
+#               A stack is written bottom to top, one letter per piece, and an empty square as '-'.  Squares are
+#               numbered row by row from 0.  Players are 1 and 2, and counts are given player1 first.  Frames are
+#               kept in a buffer until drained, so a feed sends them to its viewers in one write rather than line by
+#               line.
+
+from domination import MAX_STACK_LIMIT, _COLORS
+
+# Text of every stack code up to the largest stack limit, whatever the board.
+_STACK_TEXT = [''.join(_COLORS[(code >> i) & 1] for i in range(code.bit_length() - 1)) or '-'
+               for code in range(1 << (MAX_STACK_LIMIT + 1))]
+
+# Methods a renderer wraps on the game it watches.
+_HOOKS = ('_finalize', '_place', '_update_scores', 'unmake_move', 'restore')
+
+
+class BoardRenderer:
+    """Renders one game as a stream of delta frames and on-demand keyframes."""
+
+    def __init__(self, game):
+        """Start watching game.  The first frame made is a keyframe."""
+        self.game = game
+        self.sequence = 0
+        self._buffer = []
+        self._dirty = set()                 # squares changed since the last frame
+        self._shown = None                  # stack codes as of the last frame, None until a keyframe is made
+        self._counts = None                 # reserves and captured counts as of the last frame
+        self._turn = None
+        self._saved = {name: game.__dict__.get(name) for name in _HOOKS}
+        self._attach()
+
+    def _attach(self):
+        game = self.game
+        dirty = self._dirty
+        finalize = game._finalize
+        place = game._place
+        update_scores = game._update_scores
+        unmake_move = game.unmake_move
+        restore = game.restore
+
+        def watched_finalize(player, origin, target, num_pieces):
+            dirty.add(origin)
+            dirty.add(target)
+            finalize(player, origin, target, num_pieces)
+
+        def watched_place(player, target, reserve=-1):
+            dirty.add(target)
+            place(player, target, reserve)
+
+        def watched_update_scores(player, square, stack, reserve):
+            dirty.add(square)
+            update_scores(player, square, stack, reserve)
+
+        def watched_unmake_move():
+            record = game._undo[-1]
+            dirty.add(record[0])
+            dirty.add(record[2])
+            unmake_move()
+
+        def watched_restore(state):
+            restore(state)
+            dirty.update(range(len(game._board)))
+
+        game._finalize = watched_finalize
+        game._place = watched_place
+        game._update_scores = watched_update_scores
+        game.unmake_move = watched_unmake_move
+        game.restore = watched_restore
+
+    def detach(self):
+        """Stop watching the game, putting back whatever methods it had before."""
+        for name, method in self._saved.items():
+            if (method is None):
+                self.game.__dict__.pop(name, None)
+            else:
+                self.game.__dict__[name] = method
+
+    def _game_counts(self):
+        game = self.game
+        return (game._reserve[0], game._reserve[1], game._captured[0], game._captured[1])
+
+    def keyframe(self):
+        """Add a keyframe with the whole position to the buffer and return it."""
+        game = self.game
+        self._shown = list(game._board)
+        self._counts = self._game_counts()
+        self._turn = game.turn
+        self._dirty.clear()
+        stacks = ' '.join(_STACK_TEXT[code] for code in self._shown)
+        return self._emit('K %d %s t=%s r=%d,%d c=%d,%d\n'
+                          % ((self.sequence, stacks, self._player(self._turn)) + self._counts))
+
+    def _player(self, name):
+        """Return how frames write the player who moved last: 1, 2 or '-' for nobody."""
+        player = self.game._index.get(name)
+        return '-' if player is None else str(player + 1)
+
+    def frame(self):
+        """Add a delta frame for what changed since the last frame to the buffer and return it, or return '' and add
+        nothing when nothing changed.  The first frame is a keyframe."""
+        if (self._shown is None):
+            return self.keyframe()
+        board = self.game._board
+        shown = self._shown
+        parts = []
+        for square in sorted(self._dirty):
+            code = board[square]
+            if (code != shown[square]):
+                shown[square] = code
+                parts.append('%d:%s' % (square, _STACK_TEXT[code]))
+        self._dirty.clear()
+
+        turn = self.game.turn
+        if (turn != self._turn):
+            self._turn = turn
+            parts.append('t=' + self._player(turn))
+        counts = self._game_counts()
+        if (counts[:2] != self._counts[:2]):
+            parts.append('r=%d,%d' % counts[:2])
+        if (counts[2:] != self._counts[2:]):
+            parts.append('c=%d,%d' % counts[2:])
+        self._counts = counts
+
+        if (not parts):
+            return ''
+        return self._emit('D %d %s\n' % (self.sequence, ' '.join(parts)))
+
+    def _emit(self, line):
+        self.sequence += 1
+        self._buffer.append(line)
+        return line
+
+    def drain(self):
+        """Return every frame buffered since the last drain as one string, and empty the buffer."""
+        text = ''.join(self._buffer)
+        self._buffer.clear()
+        return text
+
+
+def apply_frame(position, line):
+    """Apply a frame line to a viewer's position and return it: a dict with 'stacks' (a stack string per square),
+    'turn' (1, 2 or None), 'reserve' and 'captured'.  Pass None as the position to start from a keyframe.  Raise
+    ValueError when a delta's sequence number does not follow the last frame applied, which means a keyframe is
+    needed."""
+    fields = line.split()
+    kind = fields[0]
+    sequence = int(fields[1])
+    if (kind == 'K'):
+        end = len(fields) - 3           # the stacks are followed by t=, r= and c=
+        position = {'stacks': fields[2:end], 'turn': None, 'reserve': (0, 0), 'captured': (0, 0)}
+        fields = fields[end:]
+    elif (position is None or position['sequence'] != sequence - 1):
+        raise ValueError('frame %d does not follow the last frame applied' % sequence)
+    else:
+        fields = fields[2:]
+
+    for field in fields:
+        if (field.startswith('t=')):
+            position['turn'] = None if field == 't=-' else int(field[2:])
+        elif (field.startswith('r=')):
+            position['reserve'] = tuple(int(count) for count in field[2:].split(','))
+        elif (field.startswith('c=')):
+            position['captured'] = tuple(int(count) for count in field[2:].split(','))
+        else:
+            square, stack = field.split(':')
+            position['stacks'][int(square)] = stack
+    position['sequence'] = sequence
+    return position
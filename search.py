@@ -0,0 +1,221 @@
+# Description: Built-in computer player for FocusGame.  SearchEngine looks for the best move within a wall-clock
+#               budget using iterative deepening negamax with alpha-beta pruning, a transposition table, killer
+#               moves and the history heuristic.  Positions are walked with make_move / unmake_move, so the game
+#               passed in is left exactly as it was found.  With canonical set, the table is keyed by the
+#               symmetry-canonical form of each position (symmetry.py), so symmetric positions share entries.
+
+import time
+
+from domination import decode_move
+from symmetry import canonical_key, inverse, transform_move
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+WIN_SCORE = 1000000         # score of a won position, less the number of plies it takes to get there
+CHECK_EVERY = 1024          # number of nodes searched between clock checks
+
+# Default weights of the evaluation terms.
+CAPTURED_WEIGHT = 100
+STACKS_WEIGHT = 10
+RESERVE_WEIGHT = 40
+
+
+def weighted_evaluation(captured=CAPTURED_WEIGHT, stacks=STACKS_WEIGHT, reserve=RESERVE_WEIGHT):
+    """Return an evaluation function scoring a position for name as the weighted difference between the two
+    players' captured pieces, stacks with their piece on top, and pieces in reserve."""
+
+    def evaluate(game, name, other):
+        return (captured * (game.show_captured(name) - game.show_captured(other))
+                + stacks * (game.controlled_stacks(name) - game.controlled_stacks(other))
+                + reserve * (game.show_reserve(name) - game.show_reserve(other)))
+
+    return evaluate
+
+
+evaluate = weighted_evaluation()
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+
+class SearchResult:
+    """Outcome of one search: the best move found, its score and how much work it took."""
+
+    def __init__(self, move, score, depth, nodes, elapsed, decode=decode_move):
+        self.encoded_move = move                                    # best move as an integer, None if no move
+        self.move = decode(move) if move is not None else None      # best move as (source, destination, pieces)
+        self.score = score                                          # score of the move for the player to move
+        self.depth = depth                                          # deepest fully searched iteration
+        self.nodes = nodes                                          # positions visited
+        self.elapsed = elapsed                                      # seconds spent
+
+    @property
+    def nodes_per_second(self):
+        """Return the search speed."""
+        if (self.elapsed <= 0):
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def __repr__(self):
+        return ('SearchResult(move=%r, score=%r, depth=%d, nodes=%d, nps=%.0f)'
+                % (self.move, self.score, self.depth, self.nodes, self.nodes_per_second))
+
+
+class SearchEngine:
+    """Alpha-beta search over FocusGame positions.  The evaluation is any function taking (game, name, other)
+    and returning a score for name; the engine keeps its transposition table and history between searches.  A
+    canonical engine stores moves in the table as they are in the canonical position."""
+
+    def __init__(self, evaluation=evaluate, table=None, canonical=False):
+        self.evaluation = evaluation
+        self.table = table if table is not None else TranspositionTable()
+        self.canonical = canonical
+        self._history = {}          # move -> bonus earned by causing cutoffs
+        self._killers = []          # per ply, the last two quiet moves that caused a cutoff
+
+    def search(self, game, name, time_limit=0.1, max_depth=64, depths=None):
+        """Return a SearchResult with the best move for name, searching deeper until time_limit seconds pass or
+        max_depth is reached.  The result comes from the deepest iteration that finished.  depths, if given, lists
+        the depths to search in order instead of every depth from 1 to max_depth."""
+        self._game = game
+        self._deadline = time.perf_counter() + time_limit
+        self._nodes = 0
+        self._killers = [[None, None] for ply in range(max_depth + 1)]
+        start = time.perf_counter()
+        undo_depth = len(game._undo)
+        other = game.opponent(name)
+
+        best_move = None
+        best_score = 0
+        depth_reached = 0
+        try:
+            for depth in (depths if depths is not None else range(1, max_depth + 1)):
+                score, move = self._root(depth, name, other, best_move)
+                best_move, best_score, depth_reached = move, score, depth
+
+                # Stop early when the result is a forced win or loss, or there is nothing to choose from.
+                if (move is None or abs(score) >= WIN_SCORE - max_depth):
+                    break
+        except SearchTimeout:
+            while (len(game._undo) > undo_depth):
+                game.unmake_move()
+
+        # If not even the first iteration finished, fall back on the first legal move.
+        if (best_move is None):
+            moves = game.legal_moves_encoded(name)
+            if (moves):
+                best_move = moves[0]
+        return SearchResult(best_move, best_score, depth_reached, self._nodes, time.perf_counter() - start,
+                            game.decode_move)
+
+    def _root(self, depth, name, other, previous):
+        """Search every root move to the given depth, trying the previous iteration's best move first."""
+        game = self._game
+        moves = self._order(game.legal_moves_encoded(name), previous, 0)
+        if (not moves):
+            return -WIN_SCORE, None
+
+        alpha = -WIN_SCORE - 1
+        best_move = moves[0]
+        for move in moves:
+            game.make_move(name, move)
+            score = -self._negamax(depth - 1, -WIN_SCORE - 1, -alpha, other, name, 1)
+            game.unmake_move()
+            if (score > alpha):
+                alpha = score
+                best_move = move
+        if (self.canonical):
+            key, transform = canonical_key(game)
+            self.table.store(key, depth, alpha, EXACT, transform_move(best_move, transform))
+        else:
+            self.table.store(game.position_hash(), depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, depth, alpha, beta, name, other, ply):
+        """Return the score of the position for name, the player to move, searched depth plies deep."""
+        game = self._game
+        self._nodes += 1
+        if (self._nodes % CHECK_EVERY == 0 and time.perf_counter() > self._deadline):
+            raise SearchTimeout()
+
+        # The opponent's last move may have won the game.
+        if (game.show_captured(other) >= game.win_captures):
+            return ply - WIN_SCORE
+        if (depth <= 0):
+            return self.evaluation(game, name, other)
+
+        # Use a stored result when it was searched at least as deep and settles the window.
+        if (self.canonical):
+            key, transform = canonical_key(game)
+        else:
+            key = game.position_hash()
+        entry = self.table.probe(key)
+        table_move = None
+        if (entry is not None):
+            stored_depth, value, flag, table_move = entry
+            if (self.canonical and table_move is not None):
+                table_move = transform_move(table_move, inverse(transform))
+            if (stored_depth >= depth):
+                if (flag == EXACT):
+                    return value
+                elif (flag == LOWER and value >= beta):
+                    return value
+                elif (flag == UPPER and value <= alpha):
+                    return value
+
+        # A player with no stack to move and nothing in reserve has lost.
+        moves = game.legal_moves_encoded(name)
+        if (not moves):
+            return ply - WIN_SCORE
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for move in self._order(moves, table_move, ply):
+            game.make_move(name, move)
+            score = -self._negamax(depth - 1, -beta, -alpha, other, name, ply + 1)
+            game.unmake_move()
+
+            if (score > best_score):
+                best_score = score
+                best_move = move
+                if (score > alpha):
+                    alpha = score
+
+                    # Remember moves that refute the opponent's play so they are tried early elsewhere.
+                    if (alpha >= beta):
+                        killers = self._killers[ply]
+                        if (killers[0] != move):
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self._history[move] = self._history.get(move, 0) + depth * depth
+                        break
+
+        if (best_score <= original_alpha):
+            flag = UPPER
+        elif (best_score >= beta):
+            flag = LOWER
+        else:
+            flag = EXACT
+        if (self.canonical and best_move is not None):
+            best_move = transform_move(best_move, transform)
+        self.table.store(key, depth, best_score, flag, best_move)
+        return best_score
+
+    def _order(self, moves, first, ply):
+        """Sort moves best first: the table move, then the killer moves, then by history bonus."""
+        history = self._history
+        moves.sort(key=lambda move: history.get(move, 0), reverse=True)
+        front = [first] if first in moves else []
+        if (ply < len(self._killers)):
+            for killer in self._killers[ply]:
+                if (killer is not None and killer != first and killer in moves):
+                    front.append(killer)
+        if (not front):
+            return moves
+        return front + [move for move in moves if move not in front]
+
+
+def best_move(game, name, time_limit=0.1):
+    """Return the best move found for name within time_limit seconds, as (source, destination, num_pieces)."""
+    return SearchEngine().search(game, name, time_limit).move
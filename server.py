@@ -0,0 +1,259 @@
+# Description: Asyncio server hosting many FocusGame sessions in one process.  Clients talk line-delimited JSON
+#               over TCP or a Unix socket: each line is a request object with an "op", and each reply is one line
+#               carrying the request's "id" and either a "result" or an "error".
+#
+#                 {"id": 1, "op": "new", "player1": ["A", "R"], "player2": ["B", "G"]}   -> result: game id
+#                 {"id": 2, "op": "move", "game": g, "name": "A", "source": [0, 0], "destination": [0, 1],
+#                  "num_pieces": 1}                                                       -> move_piece result
+#                 {"id": 3, "op": "reserve", "game": g, "name": "A", "destination": [0, 1]} -> reserved_move result
+#                 {"id": 4, "op": "show_pieces", "game": g, "square": [0, 1]}
+#                 {"id": 5, "op": "show_reserve" / "show_captured", "game": g, "name": "A"}
+#                 {"id": 6, "op": "legal_moves", "game": g, "name": "A"}
+#                 {"id": 7, "op": "close", "game": g}
+#                 {"id": 8, "op": "stats"} / {"id": 9, "op": "metrics"}   -> profiler figures, dict / Prometheus text
+#
+#               Every session has its own lock, and sessions nobody has used for a while are evicted.  With
+#               --profile every session is instrumented by one profiling.Profiler, which stats and metrics report.
+#
+#               python server.py serve --port 7878 --profile
+#               python server.py loadgen --port 7878 --sessions 2000 --moves 20
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from domination import FocusGame
+from profiling import Profiler
+
+IDLE_TIMEOUT = 300.0        # seconds a session may go unused before it is evicted
+SWEEP_INTERVAL = 10.0       # seconds between eviction sweeps
+
+
+class Session:
+    """One hosted game with the lock serialising requests to it."""
+
+    __slots__ = ('game', 'lock', 'last_used')
+
+    def __init__(self, game):
+        self.game = game
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class GameServer:
+    """Registry of sessions and the request handlers that act on them."""
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, sweep_interval=SWEEP_INTERVAL, profiler=None):
+        self.sessions = {}
+        self.profiler = profiler        # profiling.Profiler attached to every new session, if any
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.requests = 0
+        self.evicted = 0
+        self._ids = itertools.count(1)
+        self._sweeper = None
+
+    async def handle(self, request):
+        """Run one decoded request and return the reply object."""
+        self.requests += 1
+        reply = {'id': request.get('id')}
+        operation = request.get('op')
+        try:
+            if (operation == 'new'):
+                game_id = str(next(self._ids))
+                game = FocusGame(tuple(request['player1']), tuple(request['player2']))
+                if (self.profiler is not None):
+                    self.profiler.attach(game)
+                self.sessions[game_id] = Session(game)
+                reply['result'] = game_id
+                return reply
+            elif (operation in ('stats', 'metrics')):
+                if (self.profiler is None):
+                    reply['error'] = 'profiling is off'
+                elif (operation == 'stats'):
+                    reply['result'] = self.profiler.snapshot()
+                else:
+                    reply['result'] = self.profiler.prometheus()
+                return reply
+
+            session = self.sessions.get(request.get('game'))
+            if (session is None):
+                reply['error'] = 'unknown game'
+                return reply
+            if (operation == 'close'):
+                del self.sessions[request['game']]
+                reply['result'] = True
+                return reply
+
+            async with session.lock:
+                session.last_used = time.monotonic()
+                reply['result'] = self._dispatch(session.game, operation, request)
+        except (KeyError, TypeError, IndexError, ValueError) as error:
+            reply['error'] = 'bad request: %s' % error
+        return reply
+
+    def _dispatch(self, game, operation, request):
+        """Call the FocusGame method for an operation on an existing session."""
+        if (operation == 'move'):
+            return game.move_piece(request['name'], tuple(request['source']), tuple(request['destination']),
+                                   request['num_pieces'])
+        elif (operation == 'reserve'):
+            return game.reserved_move(request['name'], tuple(request['destination']))
+        elif (operation == 'show_pieces'):
+            return game.show_pieces(tuple(request['square']))
+        elif (operation == 'show_reserve'):
+            return game.show_reserve(request['name'])
+        elif (operation == 'show_captured'):
+            return game.show_captured(request['name'])
+        elif (operation == 'legal_moves'):
+            return game.legal_moves(request['name'])
+        raise ValueError('unknown op %r' % operation)
+
+    async def serve_client(self, reader, writer):
+        """Answer requests from one connection, one line each, until it closes."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # The rest of an over-long line cannot be told apart from the next request, so give up on the
+                    # connection after saying why.
+                    writer.write(json.dumps({'id': None, 'error': 'line too long'}).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if (not line):
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    reply = {'id': None, 'error': 'bad json'}
+                else:
+                    reply = await self.handle(request) if isinstance(request, dict) else {'error': 'bad request'}
+                writer.write(json.dumps(reply).encode() + b'\n')
+
+                # Only wait on the socket when its buffer is filling up.
+                if (writer.transport.get_write_buffer_size() > 65536):
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def evict_idle(self):
+        """Drop sessions unused for longer than the idle timeout and return how many went."""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [game_id for game_id, session in self.sessions.items()
+                if session.last_used < cutoff and not session.lock.locked()]
+        for game_id in idle:
+            del self.sessions[game_id]
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    async def start(self, host='127.0.0.1', port=7878, path=None):
+        """Start listening on a Unix socket when path is given, otherwise on TCP, and return the asyncio server."""
+        if (self._sweeper is None):
+            self._sweeper = asyncio.ensure_future(self._sweep())
+        if (path is not None):
+            return await asyncio.start_unix_server(self.serve_client, path=path, limit=1 << 16)
+        return await asyncio.start_server(self.serve_client, host, port, limit=1 << 16)
+
+    def stop(self):
+        if (self._sweeper is not None):
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+async def _client(connect, sessions, moves, latencies, rng):
+    """Play random games over one connection: sessions games of up to moves moves each."""
+    reader, writer = await connect()
+    request_ids = itertools.count()
+
+    async def call(**request):
+        request['id'] = next(request_ids)
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b'\n')
+        reply = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        return reply.get('result')
+
+    for index in range(sessions):
+        game = await call(op='new', player1=['A', 'R'], player2=['B', 'G'])
+        names = ('A', 'B')
+        for ply in range(moves):
+            name = names[ply % 2]
+            legal = await call(op='legal_moves', game=game, name=name)
+            if (not legal):
+                break
+            source, destination, num_pieces = rng.choice(legal)
+            if (source == "Reserves"):
+                await call(op='reserve', game=game, name=name, destination=destination)
+            else:
+                await call(op='move', game=game, name=name, source=source, destination=destination,
+                           num_pieces=num_pieces)
+        await call(op='show_captured', game=game, name='A')
+    writer.close()
+
+
+async def load_generator(host='127.0.0.1', port=7878, path=None, connections=50, sessions=1000, moves=20, seed=0):
+    """Play sessions random games spread over concurrent connections and return a dict of statistics."""
+    if (path is not None):
+        connect = lambda: asyncio.open_unix_connection(path, limit=1 << 20)
+    else:
+        connect = lambda: asyncio.open_connection(host, port, limit=1 << 20)
+    rng = random.Random(seed)
+    latencies = []
+    per_connection = max(1, sessions // connections)
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(connect, per_connection, moves, latencies, random.Random(rng.random()))
+                           for connection in range(connections)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+        'p99_ms': 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else 0.0,
+    }
+
+
+async def _serve_forever(options):
+    server = GameServer(options.idle_timeout, profiler=Profiler() if options.profile else None)
+    listener = await server.start(options.host, options.port, options.unix)
+    print('serving on %s' % (options.unix or '%s:%d' % (options.host, options.port)))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Host FocusGame sessions, or generate load against a host.')
+    parser.add_argument('mode', choices=('serve', 'loadgen'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--unix', help='Unix socket path to use instead of TCP')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT)
+    parser.add_argument('--profile', action='store_true', help='instrument every session (see profiling.py)')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--moves', type=int, default=20)
+    options = parser.parse_args(arguments)
+
+    if (options.mode == 'serve'):
+        asyncio.run(_serve_forever(options))
+    else:
+        stats = asyncio.run(load_generator(options.host, options.port, options.unix, options.connections,
+                                           options.sessions, options.moves))
+        print('%(requests)d requests in %(seconds).1f s: %(requests_per_second).0f req/s, '
+              'p50 %(p50_ms).2f ms, p99 %(p99_ms).2f ms' % stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Description: Lazy SMP: SearchEngine on several worker processes at once.  Every worker searches the same root
+#               position with its own engine, and they share one SharedTranspositionTable in shared memory
+#               (transposition.py), so what one worker finds cuts the others' searches short.  No other
+#               coordination is needed, and processes sidestep the GIL, so the search uses every core.
+#
+#               Helpers skip some depths of the iterative deepening, staggered as in Stockfish's lazy SMP, so the
+#               workers spread over neighbouring depths instead of searching the same tree in step.  The main
+#               worker searches every depth.  When the time is up the deepest completed result of any worker is
+#               played, preferring the main worker's on equal depth.
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mcts import pack_state, unpack_state
+from search import SearchEngine, SearchResult, evaluate
+from transposition import SharedTranspositionTable
+
+# Depths a helper skips: helper h skips depth d when ((d + _SKIP_PHASE[i]) // _SKIP_SIZE[i]) is odd, where i is
+# h - 1 modulo 20.
+_SKIP_SIZE = (1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4, 4)
+_SKIP_PHASE = (0, 1, 0, 1, 2, 3, 0, 1, 2, 3, 4, 5, 0, 1, 2, 3, 4, 5, 6, 7)
+
+_engines = {}       # table name -> the SearchEngine of this worker process using that table
+
+
+def worker_depths(worker, max_depth):
+    """Return the depths worker 0 (the main worker) or a helper searches, in order."""
+    if (worker == 0):
+        return list(range(1, max_depth + 1))
+    size = _SKIP_SIZE[(worker - 1) % len(_SKIP_SIZE)]
+    phase = _SKIP_PHASE[(worker - 1) % len(_SKIP_PHASE)]
+    return [depth for depth in range(1, max_depth + 1) if not ((depth + phase) // size) % 2]
+
+
+def search_worker(table_name, state, name, time_limit, max_depth, worker, evaluation=None, canonical=False):
+    """Search the packed position for name as one lazy SMP worker, with the engine this process keeps for the
+    shared table, and return (encoded move, score, depth, nodes).  evaluation defaults to search.evaluate."""
+    engine = _engines.get(table_name)
+    if (engine is None):
+        engine = _engines[table_name] = SearchEngine(table=SharedTranspositionTable(name=table_name))
+    engine.evaluation = evaluate if evaluation is None else evaluation
+    engine.canonical = canonical
+    result = engine.search(unpack_state(state), name, time_limit, max_depth, worker_depths(worker, max_depth))
+    return result.encoded_move, result.score, result.depth, result.nodes
+
+
+class LazySMPSearch:
+    """Lazy SMP over a pool of worker processes sharing a transposition table.  The pool and the table are made
+    once and reused for every search, so later searches start from what earlier ones stored; close them with
+    close() or by using the object as a context manager.  An evaluation other than the default search.evaluate
+    must be a module-level function so the workers can load it."""
+
+    def __init__(self, workers=None, buckets=1 << 18, evaluation=None, canonical=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.evaluation = evaluation
+        self.canonical = canonical
+        self.table = SharedTranspositionTable(buckets)
+        self._pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+
+    def search(self, game, name, time_limit=0.1, max_depth=64):
+        """Return a SearchResult with the deepest result the workers completed within time_limit seconds.  Its
+        node count is the total over all workers."""
+        start = time.perf_counter()
+        state = pack_state(game)
+        if (self._pool is None):
+            results = [search_worker(self.table.name, state, name, time_limit, max_depth, 0, self.evaluation,
+                                     self.canonical)]
+        else:
+            futures = [self._pool.submit(search_worker, self.table.name, state, name, time_limit, max_depth, worker,
+                                         self.evaluation, self.canonical)
+                       for worker in range(self.workers)]
+            results = [future.result() for future in futures]
+
+        # The first result of the greatest depth, so the main worker wins ties.
+        move, score, depth, nodes = max(results, key=lambda result: result[2])
+        return SearchResult(move, score, depth, sum(result[3] for result in results), time.perf_counter() - start,
+                            game.decode_move)
+
+    def close(self):
+        """Shut down the worker processes and free the shared table."""
+        if (self._pool is not None):
+            self._pool.shutdown()
+            self._pool = None
+        if (self.table is not None):
+            engine = _engines.pop(self.table.name, None)
+            if (engine is not None):
+                engine.table.close()
+            self.table.close()
+            self.table.unlink()
+            self.table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,167 @@
+# Description: Symmetry canonicalisation of FocusGame positions.  Moves go along rows and columns of a square
+#               board, so rotating or reflecting a position gives one that plays out exactly the same, and so does
+#               swapping the two colours together with the two players.  The starting position itself is unchanged
+#               by a left-right mirror, and by an upside-down mirror with the colours swapped.
+#
+#               The 16 transforms are numbered 0-15: bits 0-2 pick one of the 8 rotations and reflections in
+#               _GEOMETRY and bit 3 swaps colours and players.  A position's canonical form is the smallest of its
+#               16 transformed snapshots (FocusGame.snapshot), so every position in the same class gets the same
+#               canonical form and the same key.  Moves found in the canonical position are mapped back with the
+#               inverse transform.  Everything works on snapshot bytes with itemgetter and bytes.translate, and most
+#               positions are settled by comparing first rows alone, so a canonical key costs 10-20 microseconds.
+#               Only positions on the standard board (BOARD_SIZE, STACK_LIMIT) can be canonicalised.
+
+from operator import itemgetter
+
+from domination import (BOARD_SIZE, STACK_LIMIT, _PIECES_SHIFT, _SQUARE_BITS, _SQUARE_MASK, _STATE_COUNTS, _STATE_HASH,
+                        _STATE_TURN, _ZOBRIST_CAPTURED, _ZOBRIST_FIRST_MOVE, _ZOBRIST_RESERVE, _ZOBRIST_STACKS,
+                        _ZOBRIST_TURN, _HEIGHT)
+
+IDENTITY = 0
+TRANSFORMS = 16
+SWAP = 8            # transform bit that swaps colours and players
+
+_LAST = BOARD_SIZE - 1
+_GEOMETRY = (
+    lambda row, column: (row, column),                      # identity
+    lambda row, column: (column, _LAST - row),              # quarter turn clockwise
+    lambda row, column: (_LAST - row, _LAST - column),      # half turn
+    lambda row, column: (_LAST - column, row),              # quarter turn anticlockwise
+    lambda row, column: (row, _LAST - column),              # left-right mirror
+    lambda row, column: (_LAST - row, column),              # upside-down mirror
+    lambda row, column: (column, row),                      # main diagonal
+    lambda row, column: (_LAST - column, _LAST - row),      # anti-diagonal
+)
+
+# _SQUARE_MAP[t][square] is where transform t takes square, and _GATHER[t] picks the stacks of a board in the
+# order of the transformed board.
+def _square_map(geometry):
+    targets = []
+    for square in range(BOARD_SIZE * BOARD_SIZE):
+        row, column = geometry(square // BOARD_SIZE, square % BOARD_SIZE)
+        targets.append(row * BOARD_SIZE + column)
+    return tuple(targets)
+
+
+_SQUARE_MAP = [_square_map(_GEOMETRY[transform & 7]) for transform in range(TRANSFORMS)]
+_GATHER = []
+for _transform in range(TRANSFORMS):
+    _sources = [0] * (BOARD_SIZE * BOARD_SIZE)
+    for _square, _target in enumerate(_SQUARE_MAP[_transform]):
+        _sources[_target] = _square
+    _GATHER.append(_sources)
+
+# _GATHER_ROWS picks the first row of the 8 rotated and reflected boards in a single call, and _ROW_STARTS is where
+# each of the 16 transformed rows starts once the colour-swapped copy is appended.  Comparing first rows settles
+# most positions without building every transformed board.
+_GATHER_ROWS = itemgetter(*[source for sources in _GATHER[:8] for source in sources[:BOARD_SIZE]])
+_GATHER = [itemgetter(*sources) for sources in _GATHER]
+_ROW_STARTS = tuple(range(0, TRANSFORMS * BOARD_SIZE, BOARD_SIZE))
+
+# _INVERSE[t] undoes transform t, found by composing square maps.
+_INVERSE = tuple(
+    next(other for other in range(TRANSFORMS)
+         if other & SWAP == transform & SWAP
+         and all(_SQUARE_MAP[other][_SQUARE_MAP[transform][square]] == square
+                 for square in range(BOARD_SIZE * BOARD_SIZE)))
+    for transform in range(TRANSFORMS)
+)
+
+# Byte translation turning every stack code into the same stack with the colours swapped.
+_FLIP = bytes(code ^ ((1 << _HEIGHT[code]) - 1) if code else 0 for code in range(256))
+
+# Who moved last, or the winner, as stored in a snapshot (0 for nobody, otherwise 1 + player index), after
+# swapping the players.
+_SWAPPED_TURN = (0, 2, 1)
+
+
+def inverse(transform):
+    """Return the transform that undoes transform."""
+    return _INVERSE[transform]
+
+
+def transform_square(square, transform):
+    """Return the square index transform takes square to."""
+    return _SQUARE_MAP[transform][square]
+
+
+def transform_player(player, transform):
+    """Return the index player 0 or 1 has after transform."""
+    return player ^ (transform >> 3)
+
+
+def transform_move(move, transform):
+    """Return an encoded move (domination.encode_move) with its squares moved by transform."""
+    squares = _SQUARE_MAP[transform]
+    target = squares[(move >> _SQUARE_BITS) & _SQUARE_MASK] << _SQUARE_BITS
+    num_pieces = move >> _PIECES_SHIFT
+    if (num_pieces == 0):
+        return target
+    return squares[move & _SQUARE_MASK] | target | (num_pieces << _PIECES_SHIFT)
+
+
+def _with_hash(state):
+    """Return a snapshot body (everything before the hash) with its Zobrist hash appended."""
+    key = 0
+    for square in range(_STATE_COUNTS):
+        key ^= _ZOBRIST_STACKS[square][state[square]]
+    key ^= _ZOBRIST_RESERVE[0][state[_STATE_COUNTS]] ^ _ZOBRIST_RESERVE[1][state[_STATE_COUNTS + 1]]
+    key ^= _ZOBRIST_CAPTURED[0][state[_STATE_COUNTS + 2]] ^ _ZOBRIST_CAPTURED[1][state[_STATE_COUNTS + 3]]
+    if (state[_STATE_TURN]):
+        key ^= _ZOBRIST_TURN[state[_STATE_TURN] - 1]
+    if (state[_STATE_TURN + 1] & 3 == 2):
+        key ^= _ZOBRIST_FIRST_MOVE
+    return state + key.to_bytes(8, 'little')
+
+
+def _tail(state, swap):
+    """Return the counts, turn and firstMove bytes of a snapshot, with the players swapped if swap is set."""
+    if (not swap):
+        return state[_STATE_COUNTS:_STATE_HASH]
+    counts = state[_STATE_COUNTS:_STATE_TURN]
+    flags = state[_STATE_TURN + 1]      # firstMove, and the winner in bits 2-3
+    return bytes((counts[1], counts[0], counts[3], counts[2], _SWAPPED_TURN[state[_STATE_TURN]],
+                  (flags & 3) | (_SWAPPED_TURN[flags >> 2] << 2)))
+
+
+def transform_state(state, transform):
+    """Return the snapshot of the position transform takes the snapshot state to."""
+    board = bytes(_GATHER[transform](state[:_STATE_COUNTS]))
+    if (transform & SWAP):
+        board = board.translate(_FLIP)
+    return _with_hash(board + _tail(state, transform & SWAP))
+
+
+def canonical_state(state):
+    """Return (canonical snapshot, transform) for a snapshot: the smallest of its transformed snapshots and the
+    transform that gives it.  Map moves into the canonical position with transform_move(move, transform) and back
+    with transform_move(move, inverse(transform))."""
+    rows = bytes(_GATHER_ROWS(state))
+    rows += rows.translate(_FLIP)
+    rows = [rows[start:start + BOARD_SIZE] for start in _ROW_STARTS]
+    first = min(rows)
+    transform = rows.index(first)
+
+    # Only transforms tied on the first row need their whole snapshot compared.
+    if (rows.count(first) > 1):
+        best = None
+        for candidate in range(transform, TRANSFORMS):
+            if (rows[candidate] == first):
+                body = bytes(_GATHER[candidate](state))
+                if (candidate & SWAP):
+                    body = body.translate(_FLIP)
+                body += _tail(state, candidate & SWAP)
+                if (best is None or body < best):
+                    best = body
+                    transform = candidate
+        return _with_hash(best), transform
+    return transform_state(state, transform), transform
+
+
+def canonical_key(game):
+    """Return (key, transform) for a game's position: the 64-bit hash of its canonical form and the transform
+    taking the position there.  Positions that are symmetric to each other get the same key."""
+    if (game.board_size != BOARD_SIZE or game.stack_limit != STACK_LIMIT):
+        raise ValueError('only positions on the standard %dx%d board can be canonicalised' % (BOARD_SIZE, BOARD_SIZE))
+    state, transform = canonical_state(game.snapshot())
+    return int.from_bytes(state[_STATE_HASH:], 'little'), transform
@@ -0,0 +1,342 @@
+# Description: Retrograde solver and win/draw/loss tablebase for reduced Focus variants: small boards and low stack
+#               limits, as made by FocusGame(board_size=..., stack_limit=..., win_captures=...).  The solver
+#               enumerates every position reachable from the given roots (by default the start, with either player
+#               moving first) with make / unmake_move, stacks, reserves and captured counts included, then solves
+#               them all by retrograde analysis: positions where the last mover reached win_captures, or where the
+#               player to move has no move, are lost, and results are passed back along the moves until nothing
+#               changes.  What is left is a draw, since moving a stack onto its own square passes the turn and games
+#               can go round in circles.
+#
+#               Positions are identified by their Zobrist hash with the player to move instead of the last mover,
+#               and the file indexes them with a hash-and-displace perfect hash: every position falls in a bucket,
+#               and each bucket stores the pair of displacements that sends its positions to free slots, so a
+#               lookup is two reads at computed offsets in the mapped file.  A file is the magic bytes b'FOCUSTB'
+#               and a version byte, then little-endian:
+#
+#                 board_size, stack_limit, win_captures     uint8 each, and one byte of padding
+#                 salt                                      uint64, mixed into the hash
+#                 slots, buckets, positions                 uint32 each
+#                 displacements                             d0 and d1, uint32 each, per bucket
+#                 entries                                   uint32 per slot: top 30 bits of the position's hash,
+#                                                           then the result in the low 2 bits, 0 for an empty slot
+#
+#               Checking the stored hash bits turns away positions that are not in the table instead of returning
+#               another position's result.
+#
+#               python tablebase.py build focus3.tb --size 3 --limit 1 --win 2
+#               python tablebase.py info focus3.tb
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+
+from domination import FocusGame
+
+MAGIC = b'FOCUSTB\x01'
+WIN = 1             # the player to move wins with best play
+LOSS = 2            # the player to move loses with best play
+DRAW = 3            # neither player can force a win
+RESULT_NAMES = {WIN: 'win', LOSS: 'loss', DRAW: 'draw'}
+
+PLAYERS = (('Player1', 'R'), ('Player2', 'G'))
+MAX_POSITIONS = 4000000         # the solver gives up beyond this many positions
+_HEADER = struct.Struct('<BBBxQIII')
+_DISPLACEMENTS = struct.Struct('<II')
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_BUCKET_SIZE = 4                # positions per bucket on average
+_LOAD = 0.95                    # positions per slot
+_MAX_SPREAD = 64                # values of d0 tried for a bucket before changing the salt
+
+
+def position_key(game, player):
+    """Return the 64-bit key of the game's position with player 0 or 1 to move: its Zobrist hash with the key of
+    the player to move in place of the last mover's."""
+    return game._hash ^ game._geometry.zobrist_turn[player]
+
+
+def _hashes(key, salt, buckets, slots):
+    """Return the bucket of a key and the two hashes that, with its bucket's displacements (d0, d1), give its slot
+    as (first + d0 * second + d1) % slots."""
+    mixed = (key ^ salt) * _MULTIPLIER
+    return (mixed >> 64) % buckets, ((mixed >> 32) & 0xFFFFFFFF) % slots, 1 + (mixed & 0xFFFFFFFF) % (slots - 1)
+
+
+def _prime_at_least(number):
+    """Return the smallest prime no smaller than number."""
+    number = max(number, 3) | 1
+    while (any(number % divisor == 0 for divisor in range(3, int(number ** 0.5) + 1, 2))):
+        number += 2
+    return number
+
+
+def enumerate_positions(board_size, stack_limit, win_captures, roots=None, max_positions=MAX_POSITIONS):
+    """Return (keys, offsets, successors, lost) for every position reachable from roots, a list of (snapshot,
+    player to move) pairs for a game of that shape.  Position i has key keys[i] and its moves lead to positions
+    successors[offsets[i]:offsets[i + 1]]; lost[i] is set for positions lost before moving, where the last mover
+    has already won or the player to move has no move.  Raise ValueError past max_positions positions."""
+    game = FocusGame(PLAYERS[0], PLAYERS[1], board_size, stack_limit, win_captures)
+    if (roots is None):
+        state = game.snapshot()
+        roots = [(state, 0), (state, 1)]
+
+    keys = array('Q')
+    index = {}
+    pending = []            # (snapshot, player) of every position, by index, until it is expanded
+    for state, player in roots:
+        game.restore(state)
+        key = position_key(game, player)
+        if (key not in index):
+            index[key] = len(keys)
+            keys.append(key)
+            pending.append((state, player))
+
+    offsets = array('I', [0])
+    successors = array('I')
+    lost = bytearray()
+    position = 0
+    while (position < len(pending)):
+        state, player = pending[position]
+        pending[position] = None
+        position += 1
+        game.restore(state)
+        moves = [] if game.captured(1 - player) >= win_captures else game.moves(player)
+        lost.append(not moves)
+        for move in moves:
+            game.make(player, move)
+            key = position_key(game, 1 - player)
+            child = index.get(key)
+            if (child is None):
+                child = index[key] = len(keys)
+                if (child >= max_positions):
+                    raise ValueError('more than %d positions' % max_positions)
+                keys.append(key)
+                pending.append((game.snapshot(), 1 - player))
+            successors.append(child)
+            game.unmake_move()
+        offsets.append(len(successors))
+    return keys, offsets, successors, lost
+
+
+def solve(offsets, successors, lost):
+    """Return a bytearray with the WIN, LOSS or DRAW result of every position, for the player to move, by
+    retrograde analysis over the move graph enumerate_positions returns."""
+    count = len(lost)
+
+    # Predecessors of every position, one per move, in the same layout as the successors.
+    starts = array('I', bytes(4 * (count + 1)))
+    for child in successors:
+        starts[child + 1] += 1
+    for position in range(count):
+        starts[position + 1] += starts[position]
+    filled = array('I', starts)
+    predecessors = array('I', bytes(4 * len(successors)))
+    for position in range(count):
+        for edge in range(offsets[position], offsets[position + 1]):
+            child = successors[edge]
+            predecessors[filled[child]] = position
+            filled[child] += 1
+
+    # Every move of a lost position's predecessor wins; a position loses once every one of its moves reaches a
+    # won position.
+    results = bytearray(count)
+    remaining = array('I', (offsets[position + 1] - offsets[position] for position in range(count)))
+    queue = [position for position in range(count) if lost[position]]
+    for position in queue:
+        results[position] = LOSS
+    while (queue):
+        position = queue.pop()
+        result = results[position]
+        for edge in range(starts[position], starts[position + 1]):
+            parent = predecessors[edge]
+            if (results[parent]):
+                continue
+            if (result == LOSS):
+                results[parent] = WIN
+                queue.append(parent)
+            else:
+                remaining[parent] -= 1
+                if (remaining[parent] == 0):
+                    results[parent] = LOSS
+                    queue.append(parent)
+    return bytearray(result or DRAW for result in results)
+
+
+def _perfect_hash(keys, salt):
+    """Return (slots, displacements, slot of every key) for a perfect hash of keys with salt, where
+    displacements holds (d0, d1) for every bucket, or None when some bucket cannot be placed."""
+    buckets = max(1, len(keys) // _BUCKET_SIZE)
+    slots = _prime_at_least(int(len(keys) / _LOAD) + 1)
+    members = [[] for bucket in range(buckets)]
+    for position, key in enumerate(keys):
+        bucket, first, second = _hashes(key, salt, buckets, slots)
+        members[bucket].append((position, first, second))
+
+    # Place the largest buckets first, while most slots are free.  d0 spreads a bucket's keys apart and d1 shifts
+    # them together onto free slots.
+    taken = bytearray(slots)
+    displacements = array('I', bytes(8 * buckets))
+    placed = array('I', bytes(4 * len(keys)))
+    for bucket in sorted(range(buckets), key=lambda bucket: -len(members[bucket])):
+        entries = members[bucket]
+        if (not entries):
+            continue
+        for d0 in range(_MAX_SPREAD):
+            bases = [(first + d0 * second) % slots for position, first, second in entries]
+            if (len(set(bases)) < len(bases)):
+                continue
+            for d1 in range(slots):
+                chosen = [(base + d1) % slots for base in bases]
+                if (not any(taken[slot] for slot in chosen)):
+                    break
+            else:
+                continue
+            break
+        else:
+            return None
+        displacements[2 * bucket] = d0
+        displacements[2 * bucket + 1] = d1
+        for (position, first, second), slot in zip(entries, chosen):
+            taken[slot] = 1
+            placed[position] = slot
+    return slots, displacements, placed
+
+
+def write_tablebase(path, board_size, stack_limit, win_captures, keys, results):
+    """Write a tablebase file for the positions with the given keys and results."""
+    salt = 0
+    layout = _perfect_hash(keys, salt)
+    while (layout is None):
+        salt += 1
+        layout = _perfect_hash(keys, salt)
+    slots, displacements, placed = layout
+
+    entries = array('I', bytes(4 * slots))
+    for position, key in enumerate(keys):
+        entries[placed[position]] = ((key >> 34) << 2) | results[position]
+    with open(path + '.tmp', 'wb') as table:
+        table.write(MAGIC)
+        table.write(_HEADER.pack(board_size, stack_limit, win_captures, salt, slots, len(displacements) // 2,
+                                 len(keys)))
+        table.write(displacements.tobytes())
+        table.write(entries.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def build_tablebase(path, board_size, stack_limit, win_captures, roots=None, max_positions=MAX_POSITIONS):
+    """Enumerate, solve and write the tablebase of a variant, and return the number of positions of each result
+    as a {WIN: count, LOSS: count, DRAW: count} dict."""
+    keys, offsets, successors, lost = enumerate_positions(board_size, stack_limit, win_captures, roots,
+                                                          max_positions)
+    results = solve(offsets, successors, lost)
+    write_tablebase(path, board_size, stack_limit, win_captures, keys, results)
+    return {result: results.count(result) for result in (WIN, LOSS, DRAW)}
+
+
+class Tablebase:
+    """Read-only view of a tablebase file through a memory map.  Use as a context manager or call close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if (self._data[:len(MAGIC)] != MAGIC):
+            self.close()
+            raise ValueError('%s is not a FocusGame tablebase' % path)
+        (self.board_size, self.stack_limit, self.win_captures, self._salt, self._slots, self._buckets,
+         self.positions) = _HEADER.unpack_from(self._data, len(MAGIC))
+        self._displacements = len(MAGIC) + _HEADER.size
+        self._entries = self._displacements + 8 * self._buckets
+
+    def __len__(self):
+        return self.positions
+
+    def probe_key(self, key):
+        """Return WIN, LOSS or DRAW for the position with the given position_key, or None if it is not in the
+        table."""
+        bucket, first, second = _hashes(key, self._salt, self._buckets, self._slots)
+        d0, d1 = _DISPLACEMENTS.unpack_from(self._data, self._displacements + 8 * bucket)
+        slot = (first + d0 * second + d1) % self._slots
+        entry = struct.unpack_from('<I', self._data, self._entries + 4 * slot)[0]
+        if (entry >> 2 != key >> 34 or not entry & 3):
+            return None
+        return entry & 3
+
+    def probe(self, game, name):
+        """Return WIN, LOSS or DRAW for the named player to move in the game's position, or None if the position
+        is not in the table or the game is a different variant."""
+        if ((game.board_size, game.stack_limit, game.win_captures)
+                != (self.board_size, self.stack_limit, self.win_captures)):
+            return None
+        player = game.player_index(name)
+        if (player is None):
+            return None
+        return self.probe_key(position_key(game, player))
+
+    def best_move(self, game, name):
+        """Return an encoded move for name that keeps the best result the table gives, winning moves first, then
+        drawing ones.  Return None when the position is not in the table or there is no move."""
+        player = game.player_index(name)
+        if (self.probe(game, name) is None):
+            return None
+        best = None
+        best_rank = None
+        for move in game.moves(player):
+            game.make(player, move)
+            if (game.captured(player) >= self.win_captures):
+                rank = 0
+            else:
+                rank = {LOSS: 0, DRAW: 1, WIN: 2}.get(self.probe_key(position_key(game, 1 - player)), 3)
+            game.unmake_move()
+            if (best_rank is None or rank < best_rank):
+                best, best_rank = move, rank
+                if (rank == 0):
+                    break
+        return best
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Solve reduced FocusGame variants into win/draw/loss tablebases.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='enumerate and solve a variant')
+    build.add_argument('table')
+    build.add_argument('--size', type=int, default=3, help='board size')
+    build.add_argument('--limit', type=int, default=1, help='stack limit')
+    build.add_argument('--win', type=int, default=2, help='captured pieces that win')
+    build.add_argument('--max-positions', type=int, default=MAX_POSITIONS)
+    info = commands.add_parser('info', help='show what a tablebase holds and the result of the start')
+    info.add_argument('table')
+    options = parser.parse_args(arguments)
+
+    if (options.command == 'build'):
+        start = time.perf_counter()
+        counts = build_tablebase(options.table, options.size, options.limit, options.win,
+                                 max_positions=options.max_positions)
+        print('%d positions in %.1fs: %s' % (sum(counts.values()), time.perf_counter() - start,
+                                             '%d wins, %d losses, %d draws' % (counts[WIN], counts[LOSS],
+                                                                               counts[DRAW])))
+    else:
+        with Tablebase(options.table) as table:
+            game = FocusGame(PLAYERS[0], PLAYERS[1], table.board_size, table.stack_limit, table.win_captures)
+            print('%dx%d board, stack limit %d, %d captures to win: %d positions in %d slots'
+                  % (table.board_size, table.board_size, table.stack_limit, table.win_captures, len(table),
+                     table._slots))
+            for player in range(2):
+                print('start with %s to move: %s' % (PLAYERS[player][0],
+                                                     RESULT_NAMES[table.probe(game, PLAYERS[player][0])]))
+
+
+if __name__ == '__main__':
+    main()
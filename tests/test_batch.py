@@ -0,0 +1,15 @@
+"""Differential tests of BatchGame against FocusGame: random games, with some random move encodings among them,
+are played in both and compared after every ply."""
+
+import pytest
+
+from batch import differential_check
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_differential(seed):
+    differential_check(games=32, plies=150, seed=seed)
+
+
+def test_differential_no_noise():
+    differential_check(games=16, plies=300, seed=7, noise=0.0)
@@ -0,0 +1,161 @@
+"""Tests of FocusGame's incremental state: counters, hash, winner and callbacks are checked against values
+computed from scratch."""
+
+import copy
+import pickle
+import random
+
+import pytest
+
+from domination import FocusGame
+
+PLAYER_A = ('PlayerA', 'R')
+PLAYER_B = ('PlayerB', 'G')
+
+
+def piece_count(game):
+    """Return every piece in the game: on the board, in reserve and captured."""
+    return sum(len(game.show_pieces((row, column))) for row in range(game.board_size)
+               for column in range(game.board_size)) + sum(game._reserve) + sum(game._captured)
+
+
+def play_random(game, rng, plies, players=(PLAYER_A, PLAYER_B)):
+    """Play up to plies random moves through the name-based methods, preferring tall moves so that stacks
+    overflow, and return the number played."""
+    for ply in range(plies):
+        name = players[ply % 2][0]
+        moves = game.legal_moves(name)
+        if (not moves):
+            return ply
+        source, destination, num_pieces = max(rng.sample(moves, min(6, len(moves))), key=lambda move: move[2])
+        if (source == "Reserves"):
+            game.reserved_move(name, destination)
+        else:
+            game.move_piece(name, source, destination, num_pieces)
+    return plies
+
+
+def test_callbacks_see_finished_move():
+    seen = []
+
+    def check(game, *arguments):
+        features = game._features
+        game._recount()
+        seen.append((piece_count(game), game.position_hash() == game._compute_hash(), game._features == features))
+
+    rng = random.Random(16)
+    for game_number in range(20):
+        game = FocusGame(PLAYER_A, PLAYER_B)
+        game.on_capture(check)
+        game.on_game_end(check)
+        play_random(game, rng, 200)
+    assert seen
+    assert all(event == (36, True, True) for event in seen)
+
+
+def test_winner_survives_restore():
+    rng = random.Random(3)
+    for game_number in range(200):
+        game = FocusGame(PLAYER_A, PLAYER_B, board_size=3, stack_limit=2, win_captures=2)
+        first = []
+        game.on_game_end(lambda game, name: first.append(name))
+        play_random(game, rng, 300)
+        if (min(game._captured) >= game.win_captures and first == [PLAYER_B[0]]):
+            break
+    else:
+        raise AssertionError('no game where player2 won first and player1 caught up')
+    assert game.winner() == PLAYER_B[0]
+    assert game.copy().winner() == PLAYER_B[0]
+    assert FocusGame.from_state(game.snapshot(), PLAYER_A, PLAYER_B, 3, 2, 2).winner() == PLAYER_B[0]
+
+
+def test_copies_share_tables():
+    for shape in ((6, 5), (4, 3)):
+        game = FocusGame(PLAYER_A, PLAYER_B, *shape)
+        play_random(game, random.Random(20), 30)
+        for other in (copy.copy(game), copy.deepcopy(game), pickle.loads(pickle.dumps(game))):
+            assert other._geometry is game._geometry
+            assert other._zobrist_stacks is game._zobrist_stacks
+            assert other.snapshot() == game.snapshot()
+            assert list(other.__dict__) == list(game.__dict__)
+        assert len(pickle.dumps(game)) < 2000
+
+
+def test_show_pieces_off_board():
+    game = FocusGame(PLAYER_A, PLAYER_B)
+    assert game.show_pieces((5, 5)) == ['G']
+    for square in ((6, 0), (0, 6), (-1, 0), (0, -1)):
+        with pytest.raises(IndexError):
+            game.show_pieces(square)
+
+
+def test_make_move_unknown_name():
+    game = FocusGame(PLAYER_A, PLAYER_B)
+    state = game.snapshot()
+    assert game.make_move('Nobody', game.legal_moves_encoded(PLAYER_A[0])[0]) == "INVALID NAME"
+    assert game.snapshot() == state
+    assert not game._undo
+
+
+def test_unmake_restores_state():
+    rng = random.Random(3)
+    winners = 0
+    for game_number in range(50):
+        game = FocusGame(PLAYER_A, PLAYER_B, board_size=3, stack_limit=2, win_captures=2)
+        for ply in range(60):
+            name = (PLAYER_A, PLAYER_B)[ply % 2][0]
+            moves = game.legal_moves_encoded(name)
+            if (not moves):
+                break
+
+            # Take back every move from here and check nothing is left of it, then play one on.
+            before = (game.snapshot(), game._features, game.winner(), game.position_hash())
+            for move in moves:
+                game.make_move(name, move)
+                winners += game.winner() is not None and before[2] is None
+                game.unmake_move()
+                assert (game.snapshot(), game._features, game.winner(), game.position_hash()) == before
+            game.make_move(name, rng.choice(moves))
+    assert winners
+
+
+def test_finalized_placement_keeps_reserve():
+    rng = random.Random(12)
+    squares = [(row, column) for row in range(6) for column in range(6)]
+    for game_number in range(20):
+        game = FocusGame(PLAYER_A, PLAYER_B)
+        play_random(game, rng, game_number * 3)
+
+        # Place on the lowest stack so nothing overflows into the reserve.  The first game is at the start, with
+        # both reserves empty.
+        for name, color in (PLAYER_A, PLAYER_B):
+            square = min(squares, key=lambda square: len(game.show_pieces(square)))
+            stack = game.show_pieces(square)
+            reserve = game.show_reserve(name)
+            assert game.move_piece_finalized(name, "Reserves", square, 1, (name, color)) == 'successfully moved'
+            assert game.show_reserve(name) == reserve
+            assert game.show_pieces(square) == stack + [color]
+            assert game.position_hash() == game._compute_hash()
+
+
+def test_make_fires_no_callbacks():
+    rng = random.Random(16)
+    events = []
+    captures = 0
+    for game_number in range(20):
+        game = FocusGame(PLAYER_A, PLAYER_B, board_size=3, stack_limit=2, win_captures=2)
+        game.on_capture(lambda *arguments: events.append(arguments))
+        game.on_game_end(lambda *arguments: events.append(arguments))
+
+        # Make moves the way a search does, going deep and taking them all back.
+        for ply in range(40):
+            moves = game.moves(ply % 2)
+            if (not moves):
+                break
+            game.make(ply % 2, rng.choice(moves))
+            captures += sum(game._captured)
+        while (game._undo):
+            game.unmake_move()
+        assert not any(game._captured)
+    assert captures
+    assert events == []
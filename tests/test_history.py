@@ -0,0 +1,53 @@
+"""Tests of MoveLog seeking, on its own and with other instrumentation attached to the game after it."""
+
+import random
+
+from domination import FocusGame
+from history import MoveLog
+from profiling import Profiler
+from render import BoardRenderer
+
+PLAYER_A = ('PlayerA', 'R')
+PLAYER_B = ('PlayerB', 'G')
+
+
+def play_logged(game, rng, plies):
+    """Play up to plies random moves through play, preferring tall moves so that reserves fill up, and return the
+    snapshot after each, starting with the position before the first."""
+    states = [game.snapshot()]
+    for ply in range(plies):
+        moves = game.moves(ply % 2)
+        if (not moves):
+            break
+        game.play(ply % 2, max(rng.sample(moves, min(5, len(moves))), key=lambda move: move >> game._pieces_shift))
+        states.append(game.snapshot())
+    return states
+
+
+def test_seek_with_renderer_and_profiler():
+    rng = random.Random(21)
+    game = FocusGame(PLAYER_A, PLAYER_B)
+    log = MoveLog(game, interval=4)
+    renderer = BoardRenderer(game)
+    renderer.keyframe()
+    profiler = Profiler()
+    profiler.attach(game)
+    states = play_logged(game, rng, 40)
+    assert len(log) == len(states) - 1
+    assert any(game._reserve)
+    renderer.frame()
+
+    for k in (5, 17, 3, 4, 7, len(log), 0, len(log) - 1, 9):
+        start = k - k % log.interval
+        replayed = k - log.position if start <= log.position <= k else k - start
+        calls = profiler.stats['_finalize'].calls + profiler.stats['_place'].calls
+        assert log.seek(k) is game
+        assert game.snapshot() == states[k]
+
+        # The profiler times every move played again, and the renderer's next frame brings it up to date.
+        assert profiler.stats['_finalize'].calls + profiler.stats['_place'].calls - calls == replayed
+        renderer.frame()
+        assert renderer._shown == list(game._board)
+        assert renderer._counts == renderer._game_counts()
+        assert renderer._turn == game.turn
+    assert len(log) == len(states) - 1
@@ -0,0 +1,92 @@
+"""Move generation tests: legal_moves, which reads the precomputed move tables, is compared with a validator that
+tries every move through locationCheck and reserved_move, and perft counts are checked against known values."""
+
+import random
+
+import pytest
+
+from domination import FocusGame
+
+PLAYER_A = ('PlayerA', 'R')
+PLAYER_B = ('PlayerB', 'G')
+
+
+def validator_moves(game, name, color):
+    """Return the moves locationCheck and reserved_move accept for the named player of the given colour, found by
+    trying every on-board source, destination and number of pieces on a copy of the game.  Slow, but independent
+    of the move tables."""
+    squares = [(row, column) for row in range(game.board_size) for column in range(game.board_size)]
+    state = game.snapshot()
+    trial = game.copy()
+
+    accepted = []
+    for source in squares:
+        for destination in squares:
+            for num_pieces in range(1, game.stack_limit + 1):
+                # locationCheck returns a reason string for a rejected move and nothing once it has moved.
+                if (trial.locationCheck(name, source, destination, num_pieces, color) is None):
+                    accepted.append((source, destination, num_pieces))
+                    trial.restore(state)
+
+    # reserved_move returns 'no pieces in reserve' when there is nothing to place.
+    for destination in squares:
+        if (trial.reserved_move(name, destination) is None):
+            accepted.append(("Reserves", destination, 1))
+            trial.restore(state)
+    return accepted
+
+
+def check_moves(game, player):
+    """Assert that legal_moves and the validator agree for the (name, colour) player."""
+    name, color = player
+    assert sorted(game.legal_moves(name), key=str) == sorted(validator_moves(game, name, color), key=str)
+
+
+def perft(game, player, other, depth, check=False):
+    """Count the move sequences of the given depth starting with player and alternating with other, both (name,
+    colour) pairs.  With check set, compare legal_moves against the validator at every position."""
+    if (check):
+        check_moves(game, player)
+    moves = game.legal_moves_encoded(player[0])
+    if (depth <= 1):
+        return len(moves)
+
+    count = 0
+    for move in moves:
+        game.make_move(player[0], move)
+        count += perft(game, other, player, depth - 1, check)
+        game.unmake_move()
+    return count
+
+
+def play_random(game, rng, plies):
+    """Play up to plies random moves from the start, alternating from PLAYER_A, preferring tall moves so that
+    stacks overflow and reserves fill up.  Return the player to move next and the other."""
+    player, other = PLAYER_A, PLAYER_B
+    for ply in range(plies):
+        moves = game.legal_moves(player[0])
+        if (not moves):
+            break
+        source, destination, num_pieces = max(rng.sample(moves, min(5, len(moves))), key=lambda move: move[2])
+        if (source == "Reserves"):
+            game.reserved_move(player[0], destination)
+        else:
+            game.move_piece_finalized(player[0], source, destination, num_pieces, player)
+        player, other = other, player
+    return player, other
+
+
+def test_perft_start():
+    game = FocusGame(PLAYER_A, PLAYER_B)
+    assert perft(game, PLAYER_A, PLAYER_B, 1, check=True) == 78
+    assert perft(game, PLAYER_A, PLAYER_B, 2, check=True) == 5894
+
+
+@pytest.mark.parametrize('board_size, stack_limit', [(6, 5), (4, 3), (7, 6)])
+def test_random_positions(board_size, stack_limit):
+    rng = random.Random(board_size * 10 + stack_limit)
+    for game_number in range(10):
+        game = FocusGame(PLAYER_A, PLAYER_B, board_size, stack_limit)
+        player, other = play_random(game, rng, rng.randrange(5, 80))
+        check_moves(game, player)
+        check_moves(game, other)
@@ -0,0 +1,36 @@
+"""Round trip of games through a binary record archive and replay."""
+
+import random
+
+from domination import FocusGame
+from records import RecordWriter, replay
+
+
+def test_replay(tmp_path):
+    rng = random.Random(9)
+    path = str(tmp_path / 'games.rec')
+    finals = []
+    with RecordWriter(path) as writer:
+        for game_number in range(20):
+            game = FocusGame(('Player1', 'R'), ('Player2', 'G'))
+            moves = []
+            for ply in range(rng.randrange(10, 200)):
+                legal = game.moves(ply % 2)
+                if (not legal):
+                    break
+                move = rng.choice(legal)
+                game.play(ply % 2, move)
+                moves.append(move)
+            writer.write_game(moves)
+            finals.append(game.snapshot())
+
+    replayed = []
+    undo = []
+
+    def check(index, game):
+        replayed.append(game.snapshot())
+        undo.append(len(game._undo))
+
+    assert replay(path, check) == 20
+    assert replayed == finals
+    assert undo == [0] * 20
@@ -0,0 +1,31 @@
+"""Tests of the game server over a real socket."""
+
+import asyncio
+import json
+
+from server import GameServer
+
+
+async def talk(lines):
+    """Start a server, send it the lines on one connection and return the replies until it closes."""
+    game_server = GameServer()
+    server = await game_server.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1 << 20)
+    try:
+        for line in lines:
+            writer.write(line + b'\n')
+        await writer.drain()
+        return [json.loads(line) for line in (await reader.read()).splitlines()]
+    finally:
+        writer.close()
+        game_server.stop()
+        server.close()
+        await server.wait_closed()
+
+
+def test_line_too_long():
+    new = json.dumps({'id': 1, 'op': 'new', 'player1': ['A', 'R'], 'player2': ['B', 'G']}).encode()
+    show = json.dumps({'id': 2, 'op': 'show_pieces', 'game': '1', 'square': [0, 0]}).encode()
+    replies = asyncio.run(talk([new, b'x' * 70000, show]))
+    assert replies == [{'id': 1, 'result': '1'}, {'id': None, 'error': 'line too long'}]
@@ -0,0 +1,259 @@
+# Description: Self-play tournaments between FocusGame strategies.  Games are scheduled as a round robin or a
+#               gauntlet, played on a pool of worker processes through FocusGame's move_piece and reserved_move,
+#               and every finished game is appended to a JSON Lines file as soon as it comes back.  Running the
+#               same tournament again with the same file skips the games already recorded, so an interrupted run
+#               picks up where it stopped.  Ratings are estimated from the file, not from memory.
+#
+#               python tournament.py random greedy search --games 20 --out results.jsonl --workers 4
+
+import argparse
+import importlib
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from domination import WIN_CAPTURES, FocusGame, decode_move
+
+MAX_PLIES = 400     # a game still going after this many moves is a draw
+RED = 'Red'         # name of the player with the red pieces, who moves first
+GREEN = 'Green'     # name of the player with the green pieces
+
+
+def random_strategy(game, name, rng):
+    """Play a uniformly random legal move."""
+    moves = game.legal_moves_encoded(name)
+    return rng.choice(moves) if moves else None
+
+
+def greedy_strategy(game, name, rng):
+    """Play the move with the best evaluation one ply ahead, breaking ties at random."""
+    from search import evaluate
+    other = game.opponent(name)
+    best = []
+    best_score = None
+    for move in game.legal_moves_encoded(name):
+        game.make_move(name, move)
+        score = evaluate(game, name, other)
+        game.unmake_move()
+        if (best_score is None or score > best_score):
+            best = [move]
+            best_score = score
+        elif (score == best_score):
+            best.append(move)
+    return rng.choice(best) if best else None
+
+
+def search_strategy(game, name, rng):
+    """Play the move found by a 50 ms alpha-beta search."""
+    from search import SearchEngine
+    return SearchEngine().search(game, name, time_limit=0.05).encoded_move
+
+
+def mcts_strategy(game, name, rng):
+    """Play the move found by 300 single-process MCTS playouts."""
+    from mcts import grow_tree, pack_state
+    statistics = grow_tree(pack_state(game), name, 300, None, rng.getrandbits(32))
+    if (not statistics):
+        return None
+    return max(statistics, key=lambda move: statistics[move][0])
+
+
+STRATEGIES = {
+    'random': random_strategy,
+    'greedy': greedy_strategy,
+    'search': search_strategy,
+    'mcts': mcts_strategy,
+}
+
+
+def load_strategy(spec):
+    """Return the strategy named spec: a key of STRATEGIES or a 'module:function' path.  Strategies take
+    (game, name, rng) and return an encoded move, or None when they have no move."""
+    if (spec in STRATEGIES):
+        return STRATEGIES[spec]
+    module, _, function = spec.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def play_game(game_id, red, green, seed, max_plies=MAX_PLIES):
+    """Play one game between the red and green strategy specs and return its result record."""
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    strategies = {RED: load_strategy(red), GREEN: load_strategy(green)}
+    game = FocusGame((RED, 'R'), (GREEN, 'G'))
+    name, other = RED, GREEN
+    moves = []
+    winner = None
+
+    while (len(moves) < max_plies):
+        move = strategies[name](game, name, rng)
+
+        # A player left without a move loses.
+        if (move is None):
+            winner = other
+            break
+        source, destination, num_pieces = decode_move(move)
+        if (source == "Reserves"):
+            game.reserved_move(name, destination)
+        else:
+            game.move_piece(name, source, destination, num_pieces)
+        moves.append(move)
+        if (game.show_captured(name) >= WIN_CAPTURES):
+            winner = name
+            break
+        name, other = other, name
+
+    return {
+        'game': game_id,
+        'red': red,
+        'green': green,
+        'seed': seed,
+        'winner': None if winner is None else (red if winner == RED else green),
+        'winner_color': winner,
+        'plies': len(moves),
+        'moves': [decode_move(move) for move in moves],
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _play(task):
+    """Unpack a scheduled game for the worker pool."""
+    return play_game(*task)
+
+
+def round_robin(players, games_per_pair, seed=0):
+    """Return (game_id, red, green, seed) for games_per_pair games between every pair, alternating colours."""
+    schedule = []
+    for first, second in itertools.combinations(players, 2):
+        for index in range(games_per_pair):
+            red, green = (first, second) if index % 2 == 0 else (second, first)
+            schedule.append(('%s-%s-%d' % (first, second, index), red, green, seed * 1000003 + len(schedule)))
+    return schedule
+
+
+def gauntlet(challenger, opponents, games_per_pair, seed=0):
+    """Return the schedule of games_per_pair games between challenger and each opponent, alternating colours."""
+    schedule = []
+    for opponent in opponents:
+        for index in range(games_per_pair):
+            red, green = (challenger, opponent) if index % 2 == 0 else (opponent, challenger)
+            schedule.append(('%s-%s-%d' % (challenger, opponent, index), red, green, seed * 1000003 + len(schedule)))
+    return schedule
+
+
+def read_results(path):
+    """Yield the result records in a JSON Lines file one at a time, skipping a line cut short by an interrupt."""
+    if (not os.path.exists(path)):
+        return
+    with open(path) as results:
+        for line in results:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def run_tournament(schedule, path, workers=None, progress=None):
+    """Play every scheduled game not yet in the results file and append each result to it as it finishes.
+    progress, if given, is called with each new record.  Return (games played, seconds taken)."""
+    done = set(record['game'] for record in read_results(path))
+    pending = [task for task in schedule if task[0] not in done]
+    start = time.perf_counter()
+    played = 0
+
+    # Start the new results on a fresh line in case the last run stopped halfway through writing one.
+    broken = False
+    if (os.path.exists(path) and os.path.getsize(path) > 0):
+        with open(path, 'rb') as results:
+            results.seek(-1, os.SEEK_END)
+            broken = results.read(1) != b'\n'
+    with open(path, 'a') as results:
+        if (broken):
+            results.write('\n')
+        if (workers == 1):
+            finished = map(_play, pending)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(workers)
+            finished = (future.result() for future in as_completed([pool.submit(_play, task) for task in pending]))
+        try:
+            for record in finished:
+                results.write(json.dumps(record) + '\n')
+                results.flush()
+                played += 1
+                if (progress is not None):
+                    progress(record)
+        finally:
+            if (pool is not None):
+                pool.shutdown(cancel_futures=True)
+    return played, time.perf_counter() - start
+
+
+def elo_ratings(records, iterations=100):
+    """Return {player: Elo} fitted to the game results by the Bradley-Terry model, centred on 0.  A draw counts
+    half a win for each side, and every pair gets one virtual draw so an unbeaten player stays finite."""
+    scores = {}
+    games = {}
+    for record in records:
+        red, green, winner = record['red'], record['green'], record['winner']
+        if (red == green):
+            continue
+        pair = games.setdefault(red, {})
+        pair[green] = pair.get(green, 0) + 1
+        pair = games.setdefault(green, {})
+        pair[red] = pair.get(red, 0) + 1
+        red_score = 0.5 if winner is None else float(winner == red)
+        scores[red] = scores.get(red, 0.0) + red_score
+        scores[green] = scores.get(green, 0.0) + 1.0 - red_score
+
+    # Add the virtual draws, then run the minorisation-maximisation updates.
+    for player, opponents in games.items():
+        for opponent in opponents:
+            opponents[opponent] += 1
+            scores[player] = scores.get(player, 0.0) + 0.5
+    strength = dict.fromkeys(games, 1.0)
+    for iteration in range(iterations):
+        for player, opponents in games.items():
+            total = sum(count / (strength[player] + strength[opponent]) for opponent, count in opponents.items())
+            strength[player] = scores[player] / total
+
+    if (not strength):
+        return {}
+    mean = sum(math.log10(value) for value in strength.values()) / len(strength)
+    return {player: 400.0 * (math.log10(value) - mean) for player, value in strength.items()}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Play a FocusGame tournament between strategies.')
+    parser.add_argument('players', nargs='+', help='strategy names or module:function paths')
+    parser.add_argument('--games', type=int, default=10, help='games per pairing')
+    parser.add_argument('--gauntlet', help='play only this strategy against each of the others')
+    parser.add_argument('--out', default='tournament.jsonl', help='JSON Lines results file, appended to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(arguments)
+
+    if (options.gauntlet):
+        opponents = [player for player in options.players if player != options.gauntlet]
+        schedule = gauntlet(options.gauntlet, opponents, options.games, options.seed)
+    else:
+        schedule = round_robin(options.players, options.games, options.seed)
+
+    def progress(record):
+        print('%s: %s vs %s, winner %s after %d plies'
+              % (record['game'], record['red'], record['green'], record['winner'], record['plies']))
+
+    played, seconds = run_tournament(schedule, options.out, options.workers, progress)
+    if (seconds > 0):
+        print('%d games in %.1f s, %.2f games/s' % (played, seconds, played / seconds))
+    ratings = elo_ratings(read_results(options.out))
+    for player in sorted(ratings, key=ratings.get, reverse=True):
+        print('%-20s %7.1f' % (player, ratings[player]))
+
+
+if __name__ == '__main__':
+    main()
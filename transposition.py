@@ -0,0 +1,144 @@
+# Description: Fixed-size transposition table for searching FocusGame positions.  Results are keyed by the
+#               position's Zobrist hash (FocusGame.position_hash) and kept in a preallocated table, so memory use
+#               stays the same however long a search runs.
+#
+#               SharedTranspositionTable keeps the same buckets in multiprocessing.shared_memory, so processes
+#               searching at once (smp.py) see each other's results.  An entry is two 64-bit words: the result
+#               packed into one, and the key XORed with that word in the other.  Processes write without locks,
+#               and an entry torn by two writers at once no longer XORs back to its key, so it reads as a miss
+#               instead of a wrong result.
+
+from multiprocessing import shared_memory
+
+EXACT = 0       # the stored value is the exact score of the position
+LOWER = 1       # the search failed high, so the stored value is a lower bound
+UPPER = 2       # the search failed low, so the stored value is an upper bound
+
+
+class TranspositionTable:
+    """Table of search results with two entries per bucket.  The first entry of a bucket keeps the deepest result
+    seen for it and the second is always replaced, so deep results survive while recent ones still get stored."""
+
+    def __init__(self, buckets=1 << 16):
+        """Allocate the table.  The number of buckets is rounded up to a power of two."""
+        size = 1
+        while (size < buckets):
+            size = size * 2
+        self._mask = size - 1
+        self._entries = [None] * (2 * size)     # (key, depth, value, flag, move) tuples
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        """Return the number of entries the table can hold."""
+        return len(self._entries)
+
+    def probe(self, key):
+        """Return the (depth, value, flag, move) stored for the hash, or None if it is not in the table."""
+        self.probes += 1
+        index = (key & self._mask) << 1
+        entry = self._entries[index]
+        if (entry is None or entry[0] != key):
+            entry = self._entries[index + 1]
+            if (entry is None or entry[0] != key):
+                return None
+        self.hits += 1
+        return entry[1:]
+
+    def store(self, key, depth, value, flag, move):
+        """Store a search result.  It goes in the depth-preferred entry when that entry is empty, holds the same
+        position, or holds a shallower result; otherwise it replaces the bucket's second entry."""
+        index = (key & self._mask) << 1
+        entry = self._entries[index]
+        if (entry is None or entry[0] == key or entry[1] <= depth):
+            self._entries[index] = (key, depth, value, flag, move)
+        else:
+            self._entries[index + 1] = (key, depth, value, flag, move)
+
+    def clear(self):
+        """Empty the table without giving back its memory."""
+        entries = self._entries
+        for index in range(len(entries)):
+            entries[index] = None
+        self.probes = 0
+        self.hits = 0
+
+
+# Layout of a shared entry's data word: move + 1 (0 for no move), flag, depth, and value + _VALUE_OFFSET.
+_MOVE_BITS = 20
+_FLAG_SHIFT = _MOVE_BITS
+_DEPTH_SHIFT = _FLAG_SHIFT + 2
+_VALUE_SHIFT = 32
+_VALUE_OFFSET = 1 << 31
+_WORDS = 4                  # words per bucket: key and data of the two entries
+_WORD_SIZE = 8
+
+
+class SharedTranspositionTable:
+    """TranspositionTable in shared memory, with the same buckets and replacement rules.  Create one with a
+    number of buckets, then open it in other processes by its name.  The process that created it should unlink
+    it once every process is done; every process should close it."""
+
+    def __init__(self, buckets=1 << 16, name=None):
+        """Allocate a new table, the number of buckets rounded up to a power of two, or with name set, open the
+        table another process created."""
+        if (name is None):
+            size = 1
+            while (size < buckets):
+                size = size * 2
+            self._memory = shared_memory.SharedMemory(create=True, size=size * _WORDS * _WORD_SIZE)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            size = self._memory.size // (_WORDS * _WORD_SIZE)
+        self.name = self._memory.name
+        self._mask = size - 1
+        self._words = self._memory.buf.cast('Q')
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        """Return the number of entries the table can hold."""
+        return (self._mask + 1) * 2
+
+    def probe(self, key):
+        """Return the (depth, value, flag, move) stored for the hash, or None if it is not in the table."""
+        self.probes += 1
+        words = self._words
+        index = (key & self._mask) * _WORDS
+        data = words[index + 1]
+        if (not data or words[index] ^ data != key):
+            data = words[index + 3]
+            if (not data or words[index + 2] ^ data != key):
+                return None
+        self.hits += 1
+        move = (data & ((1 << _MOVE_BITS) - 1)) - 1
+        return ((data >> _DEPTH_SHIFT) & 0xFF, (data >> _VALUE_SHIFT) - _VALUE_OFFSET, (data >> _FLAG_SHIFT) & 3,
+                None if move < 0 else move)
+
+    def store(self, key, depth, value, flag, move):
+        """Store a search result, in the bucket's depth-preferred entry when it is empty, holds the same position
+        or a shallower result, and otherwise in its second entry."""
+        words = self._words
+        index = (key & self._mask) * _WORDS
+        data = ((0 if move is None else move + 1) | (flag << _FLAG_SHIFT) | (min(depth, 0xFF) << _DEPTH_SHIFT)
+                | ((value + _VALUE_OFFSET) << _VALUE_SHIFT))
+        old = words[index + 1]
+        if (old and words[index] ^ old != key and (old >> _DEPTH_SHIFT) & 0xFF > depth):
+            index += 2
+        words[index] = key ^ data
+        words[index + 1] = data
+
+    def clear(self):
+        """Empty the table for every process using it."""
+        self._memory.buf[:] = bytes(self._memory.size)
+        self.probes = 0
+        self.hits = 0
+
+    def close(self):
+        """Stop using the table in this process."""
+        self._words.release()
+        self._memory.close()
+
+    def unlink(self):
+        """Free the shared memory once every process has closed the table.  Only the creating process should."""
+        self._memory.unlink()